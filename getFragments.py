@@ -1,20 +1,158 @@
 # BioInformatics Project 3
 # 11/26/12
 
+import sys
+
 from readfasta import readfasta
 
-# A program to get the fragments out of the file
-def main():
-    sumlen = 0
+# A program to get the fragments out of the file, and to find the fragments
+# which contain the reverse complement of another fragment.
+#
+# The fragments are indexed once with a suffix array over all of them, so each
+# reverse complement is looked up with a binary search (O(m log n) for a pattern
+# of length m and n characters in total) instead of a scan over every fragment.
+#
+# Run it on a file of fragments (default: fragments.txt):
+#     $ python3 getFragments.py fragments.txt
+# or import it and call findReverseComplementMatches().
+
+# Separates the fragments in the indexed text; it never appears in a fragment, so
+# no match can span two of them
+SEPARATOR = '$'
+
+# A table to complement each base with str.translate()
+COMP_TABLE = str.maketrans('ACGT', 'TGCA')
+
+# A function to read the fragments from a file
+# @param filename The file to read, with one fragment per line (lines starting
+#                 with '>' and blank lines are skipped)
+# @return fragments The list of fragments
+def readFragments(filename='fragments.txt'):
     fragments = []
-    
-    f = open('fragments.txt', 'rU')
-    
+    f = open(filename, 'r')
+
     # Read in each line in the file
     for line in f:
         # Only get the sequences, not fragment # or newline char
-        if(line[0] != '>' and line != '\n'):
-            fragments.append(line.rstrip())
+        line = line.rstrip()
+        if(line != '' and line[0] != '>'):
+            fragments.append(line)
+    f.close()
+    return fragments
+
+# A function to get the reverse complement of a fragment
+# @param fragment The fragment to find the reverse complement of
+# @return The reverse complement of fragment
+def revcomp(fragment):
+    return fragment.translate(COMP_TABLE)[::-1]
+
+# A function to build the suffix array of a string by prefix doubling: the
+# suffixes are sorted by their first k characters, then by their first 2k, and
+# so on until every suffix has a rank of its own
+# @param text The string to index
+# @return suffixArray The starting positions of the suffixes of text, in sorted
+#                     order
+def buildSuffixArray(text):
+    n = len(text)
+    if n == 0:
+        return []
+
+    rank = [ord(letter) for letter in text]
+    suffixArray = list(range(n))
+    k = 1
+    while True:
+        # Sort by (rank of the first k characters, rank of the next k)
+        keys = [(rank[i], rank[i + k] if i + k < n else -1) for i in range(n)]
+        suffixArray.sort(key=keys.__getitem__)
+
+        newRank = [0] * n
+        for j in range(1, n):
+            newRank[suffixArray[j]] = newRank[suffixArray[j - 1]] \
+                + (keys[suffixArray[j]] != keys[suffixArray[j - 1]])
+        rank = newRank
+        if rank[suffixArray[-1]] == n - 1 or k >= n:
+            return suffixArray
+        k *= 2
+
+# A substring index over a list of fragments
+class FragmentIndex:
+
+    # @param fragments The fragments to index
+    def __init__(self, fragments):
+        self.fragments = list(fragments)
+        self.text = SEPARATOR.join(self.fragments) + SEPARATOR
+
+        # owner[p] is the index of the fragment the character at p belongs to
+        self.owner = []
+        for index, frag in enumerate(self.fragments):
+            self.owner.extend([index] * (len(frag) + 1))
+
+        self.suffixArray = buildSuffixArray(self.text)
+
+    # A function to find where a pattern occurs in the indexed fragments
+    # @param pattern The string to look for
+    # @return The range of positions in the suffix array (first, last) whose
+    #         suffixes start with pattern
+    def findRange(self, pattern):
+        text = self.text
+        suffixArray = self.suffixArray
+        m = len(pattern)
+
+        # The first suffix whose first m characters aren't less than pattern
+        low = 0
+        high = len(suffixArray)
+        while low < high:
+            middle = (low + high) // 2
+            start = suffixArray[middle]
+            if text[start:start + m] < pattern:
+                low = middle + 1
+            else:
+                high = middle
+        first = low
+
+        # The first suffix whose first m characters are greater than pattern
+        high = len(suffixArray)
+        while low < high:
+            middle = (low + high) // 2
+            start = suffixArray[middle]
+            if text[start:start + m] <= pattern:
+                low = middle + 1
+            else:
+                high = middle
+        return first, low
+
+    # A function to find the fragments which contain a pattern
+    # @param pattern The (non-empty) string to look for
+    # @return The sorted indices of the fragments which contain pattern
+    def getContainingFragments(self, pattern):
+        first, last = self.findRange(pattern)
+        return sorted(set(self.owner[self.suffixArray[p]] for p in range(first, last)))
+
+# A function to find, for each fragment, the other fragments which contain its
+# reverse complement
+# @param fragments The list of fragments
+# @param index A FragmentIndex of the fragments (built if not given)
+# @return matches A list with one tuple (fragment index, reverse complement,
+#                 indices of the fragments containing it) for each fragment
+#                 whose reverse complement is found in another fragment
+def findReverseComplementMatches(fragments, index=None):
+    if index is None:
+        index = FragmentIndex(fragments)
+
+    matches = []
+    for i, frag in enumerate(fragments):
+        if len(frag) == 0:
+            continue
+        fragToFind = revcomp(frag)
+        matchFrags = [j for j in index.getContainingFragments(fragToFind) if j != i]
+        if(len(matchFrags) != 0):
+            matches.append((i, fragToFind, matchFrags))
+    return matches
+
+def main():
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'fragments.txt'
+    fragments = readFragments(filename)
+    sumlen = 0
 
     # Print out the fragments
     for frag in fragments:
@@ -29,61 +167,17 @@ def main():
     # The length is 996
     print("Each sequence has a length of",(sumlen/4))
 
-
-
-
-
-    # Find and print the possible matching fragments for each fragment
-    while(len(fragments) != 0):
-        # Find the lowest length fragment
-        smallFrag = min(fragments)
-        fragments.remove(smallFrag)
-
-        # Find the complement of the smallest fragment
-        fragToFind = revcomp(smallFrag)
-
-        # Find what fragments match it
-        matchFrags = []
-        for frag in fragments:
-            if(fragToFind in frag):
-                matchFrags.append(frag)
-
-        # If there are possible matches, print them out
-        if(len(matchFrags) != 0):
-            print(" ")
-            print("Fragment: ",smallFrag)
-            print("Matching part: ",fragToFind)
-            print("Possible Matches in: ")
-            for match in matchFrags:
-                print(match)
-
-
-
-
-
-# A function to get the reverse complement of a fragment
-# @param fragment The fragment to find the complement of
-# @return comp_strand The complement of fragment
-def revcomp(fragment):
-    sequence = fragment
-
-    #create a dictionary for complementation
-    comp_values = {'A':'T','C':'G','G':'C','T':'A'}
-
-    #make a variable to store the complement
-    comp_strand = ''
-
-    #loop through the original strand and complement each letter
-    for letter in sequence:
-        #get the complement of the letter
-        newletter = comp_values[letter]
-    
-        #append the new letter onto the growing complement strand
-        comp_strand = comp_strand + newletter
-
-    return comp_strand
-
-
-
-
-main()
+    # Find and print the possible matching fragments for each fragment, in
+    # sorted order
+    matches = findReverseComplementMatches(fragments)
+    matches.sort(key=lambda match: fragments[match[0]])
+    for i, fragToFind, matchFrags in matches:
+        print(" ")
+        print("Fragment: ",fragments[i])
+        print("Matching part: ",fragToFind)
+        print("Possible Matches in: ")
+        for j in matchFrags:
+            print(fragments[j])
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
 '''
-Jon Beck -- Two routines to use to read a fasta file
+Jon Beck -- Routines to use to read a fasta file
 '''
+import gzip
+import mmap
+import os
+
+GZIP_MAGIC = b'\x1f\x8b'
+
 '''
 parseHeader - split out the label from the header line
 Parameter: a string starting with ">" and ending without a newline
@@ -12,6 +18,125 @@ def parseHeaderLine(line):
     label = line[1:].split(' ')[0]
     return label
 
+'''
+openSequenceFile - open a (possibly gzipped) text file for reading
+Parameter: a filename. Files starting with the gzip magic number are decompressed
+   on the fly, whatever their name.
+Return: a text-mode file object
+'''
+def openSequenceFile(filename):
+    if isGzipFile(filename):
+        return gzip.open(filename, 'rt')
+    return open(filename, 'r')
+
+'''
+isGzipFile - check whether a file starts with the gzip magic number
+Parameter: a filename
+Return: True if the file is gzipped
+'''
+def isGzipFile(filename):
+    with open(filename, 'rb') as infile:
+        return infile.read(2) == GZIP_MAGIC
+
+'''
+iterfasta - read a fasta file one record at a time
+Parameters:
+1. a filename that must be in fasta format (see readfasta below); it may be
+   gzipped
+2. useMmap: if true, memory-map the file and slice each record out of the map,
+   rather than reading it line by line. A gzipped file can't be mapped, so it
+   is always read line by line.
+Yields: for each record, a list of the same three elements readfasta returns.
+   Only one record is held in memory at a time, and each sequence is joined
+   from its lines once, rather than built up a line at a time.
+'''
+def iterfasta(filename, useMmap=False):
+    if useMmap and not isGzipFile(filename):
+        for record in iterfastaMmap(filename):
+            yield record
+        return
+
+    infile = openSequenceFile(filename)
+    try:
+        headerLine = None
+        chunks = []
+        for line in infile:
+            line = line.rstrip()
+
+            # ignore blank lines
+            if line == '':
+                continue
+
+            # if it's a header line, finish the previous sequence
+            # and start a new one
+            if line[0] == '>':
+                if headerLine is not None:
+                    yield [parseHeaderLine('>' + headerLine), headerLine, ''.join(chunks)]
+                headerLine = line[1:]
+                chunks = []
+
+            # if we're here, we must be in letters of the sequence
+            else:
+                chunks.append(line)
+
+        # we're done, so terminate the last sequence
+        if headerLine is not None:
+            yield [parseHeaderLine('>' + headerLine), headerLine, ''.join(chunks)]
+    finally:
+        infile.close()
+
+'''
+iterfastaMmap - the memory-mapped version of iterfasta. Each record is sliced out
+   of the map once and its line terminators are dropped in a single pass, so the
+   file is never split into lines.
+'''
+def iterfastaMmap(filename):
+    with open(filename, 'rb') as infile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            return
+        data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = data.find(b'>')
+            while start != -1:
+                end = data.find(b'\n>', start)
+                end = len(data) if end == -1 else end + 1
+                headerEnd = data.find(b'\n', start, end)
+                if headerEnd == -1:
+                    headerEnd = end
+                headerLine = data[start + 1:headerEnd].rstrip().decode('ascii')
+                # Every run of whitespace (line terminators included) is dropped
+                # in one pass over the record
+                sequence = b''.join(data[headerEnd:end].split()).decode('ascii')
+                yield [parseHeaderLine('>' + headerLine), headerLine, sequence]
+                start = end if end < len(data) else -1
+        finally:
+            data.close()
+
+'''
+iterSequences - read just the sequences from either a fasta file or a file with
+   one sequence per line (like the fragments.txt written by
+   team_3_scoreAlignments.py)
+Parameters: as for iterfasta
+Yields: each sequence, as a string
+'''
+def iterSequences(filename, useMmap=False):
+    infile = openSequenceFile(filename)
+    try:
+        for line in infile:
+            line = line.rstrip()
+            if line == '':
+                continue
+            if line[0] == '>':
+                break
+            yield line
+        else:
+            return
+    finally:
+        infile.close()
+
+    for label, header, sequence in iterfasta(filename, useMmap):
+        yield sequence
+
 '''
 readfasta - the subroutine that reads the fasta file
 Parameter: a filename that must be in fasta format.  The file is assumed to have:
@@ -26,39 +151,4 @@ Return: a list of lists. Each inner list will have three elements:
 3. the sequence, a single string of all the letters with no line terminators
 '''
 def readfasta(filename):
-    resultList = []
-    infile = open(filename, 'rU')
-
-    # process the first line, which must be a header line
-    line = infile.readline()
-    headerLine = line
-    label = parseHeaderLine(headerLine)
-
-    # initialize the sequence accumulator
-    sequence = ''
-
-    # process all the rest of the lines in the file
-    for line in infile:
-        line = line.rstrip()
-
-        # ignore blank lines
-        if line == '':
-            continue
-
-        # if it's a header line, finish the previous sequence
-        # and start a new one
-        if line[0] == '>':
-            resultList.append([label, headerLine, sequence])
-
-            label = parseHeaderLine(line)
-            headerLine = line[1:]
-            sequence = ''
-            
-        # if we're here, we must be in letters of the sequence
-        else:
-            sequence += line
-            
-    # we're done, so clean up, terminate the last sequence, and return
-    infile.close()
-    resultList.append([label, headerLine, sequence])
-    return resultList
+    return list(iterfasta(filename))
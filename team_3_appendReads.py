@@ -0,0 +1,224 @@
+'''
+Adds new reads to the output of an earlier run of team_3_scoreAlignments.py,
+without recomputing the overlaps between the fragments that run already compared.
+
+The earlier run's fragments.store, overlap.npy and offsets.npy are loaded, and:
+  - the new reads go through the same length filter, and the same containment
+    check against each other and the earlier fragments (an earlier fragment
+    which a new read contains is dropped as well)
+  - only the new reads are checked for belonging on the anti-sense strand: each
+    is compared (as it is and reverse-complimented) against every surviving
+    fragment, while the earlier survivors keep their place
+  - only the new rows and columns of the matrices are computed
+  - the fragment store, matrices and fragments.txt are written back out
+So adding M reads to N fragments costs O(M * (N + M)) overlap() calls instead of
+O((N + M)^2).
+
+    $ python3 team_3_appendReads.py newReads.fasta
+
+Note that the earlier survivors aren't re-checked for the anti-sense strand, so
+the result can differ slightly from rerunning team_3_scoreAlignments.py on all of
+the reads from scratch.
+
+Written for Python 3
+'''
+
+import sys
+
+import team_3_scoreAlignments as scoring
+from readfasta import iterfasta
+from team_3_containment import getContainedFragmentIndices
+from team_3_fragmentStore import FRAGMENT_STORE_FILE, TOO_SHORT, CONTAINED, ANTISENSE, \
+                                 FragmentStore, writeFragmentStore
+from team_3_matrixIO import findMatrixFile, loadMatrix, writeMatrix, writeTextMatrix
+from team_3_overlapCache import loadOverlapCache
+
+def loadPreviousRun(storeFile=FRAGMENT_STORE_FILE):
+    '''
+    @return Tuple (every fragment read so far, their filter flags, the overlap
+                   matrix of the survivors, their offset matrix)
+    '''
+    store = FragmentStore(storeFile)
+    if store.filtered and store.minLength != scoring.MIN_LENGTH:
+        raise ValueError(storeFile + " was filtered with a different MIN_LENGTH")
+    fragments = list(store)
+    flags = list(store.flags)
+    store.close()
+    overlapMatrix = loadMatrix(findMatrixFile("overlap"))
+    offsetMatrix = loadMatrix(findMatrixFile("offsets"))
+    return fragments, flags, overlapMatrix, offsetMatrix
+
+def removeContainedReads(fragments, flags, numOld):
+    '''
+    Runs the containment check on the new fragments (those from numOld onwards)
+    together with the earlier ones, and flags the new fragments and earlier
+    survivors which turn out to be contained in another fragment.
+    '''
+    # Fragments contained in another one were only flagged as such, so they can
+    # still tell us that a new read is a duplicate
+    candidates = [i for i in range(len(fragments)) if flags[i] != TOO_SHORT]
+    contained = getContainedFragmentIndices([fragments[i] for i in candidates])
+    for k in contained:
+        i = candidates[k]
+        if flags[i] == 0:
+            flags[i] = CONTAINED
+
+def getAliveMax(values, alive, floor=None):
+    best = max(value for value, isAlive in zip(values, alive) if isAlive)
+    return best if floor is None else max(floor, best)
+
+def removeAntisenseReads(newFragments, oldFragments):
+    '''
+    Does the same pruning as team_3_scoreAlignments.removeAntisenseFragments(),
+    but only removes new fragments; the old ones always survive.
+
+    @return Tuple (the indices of the surviving new fragments; the overlap and
+                   offset rows of the new fragments against the old and then the
+                   new fragments; the overlap and offset rows of the old
+                   fragments against the new ones)
+    '''
+    numOld = len(oldFragments)
+    numNew = len(newFragments)
+    allFragments = oldFragments + newFragments
+
+    newRows, newOffsetRows = scoring.getPairwiseMatrices(newFragments, allFragments)
+    oldRows, oldOffsetRows = scoring.getPairwiseMatrices(oldFragments, newFragments)
+    revCompNewRows = scoring.getPairwiseMatrices(
+        [scoring.getReverseCompliment(f) for f in newFragments], allFragments)[0]
+    revCompOldRows = scoring.getPairwiseMatrices(
+        [scoring.getReverseCompliment(f) for f in oldFragments], newFragments)[0]
+
+    # Column k of each matrix: the overlaps of every fragment with new fragment k
+    senseColumns = [ [row[k] for row in oldRows] + [row[numOld + k] for row in newRows]
+                     for k in range(numNew) ]
+    revCompColumns = [ [row[k] for row in revCompOldRows]
+                       + [row[numOld + k] for row in revCompNewRows]
+                       for k in range(numNew) ]
+    # As in removeAntisenseFragments(), a fragment's overlap with itself doesn't
+    # count
+    senseRows = [list(row) for row in newRows]
+    revCompRows = [list(row) for row in revCompNewRows]
+    for k in range(numNew):
+        senseRows[k][numOld + k] = -senseRows[k][numOld + k]
+        revCompRows[k][numOld + k] = -revCompRows[k][numOld + k]
+        senseColumns[k][numOld + k] = -senseColumns[k][numOld + k]
+        revCompColumns[k][numOld + k] = -revCompColumns[k][numOld + k]
+
+    alive = [True] * (numOld + numNew)
+    iteration = 0
+    while True:
+        toRemove = []
+        for k in range(numNew):
+            if not alive[numOld + k]:
+                continue
+            maxWhenFirst = getAliveMax(senseRows[k], alive)
+            maxWhenSecond = getAliveMax(senseColumns[k], alive, -1)
+            revCompMaxWhenFirst = getAliveMax(revCompRows[k], alive)
+            revCompMaxWhenSecond = getAliveMax(revCompColumns[k], alive, -1)
+            if (maxWhenFirst < revCompMaxWhenFirst) \
+                    and (maxWhenSecond < revCompMaxWhenSecond):
+                toRemove.append(numOld + k)
+
+        scoring.reportAntisenseIteration(iteration, len(toRemove))
+        iteration += 1
+        if len(toRemove) == 0:
+            break
+        for i in toRemove:
+            alive[i] = False
+
+    survivors = [k for k in range(numNew) if alive[numOld + k]]
+    return survivors, (newRows, newOffsetRows), (oldRows, oldOffsetRows)
+
+def extendMatrix(oldMatrix, oldKept, newRows, oldRows, numOld, newKept):
+    '''
+    @param oldMatrix The matrix of the earlier survivors
+    @param oldKept List of integers The earlier survivors (rows of oldMatrix)
+                                    which still survive
+    @param newRows Rows of the new fragments against every fragment
+    @param oldRows Rows of the earlier survivors against the new fragments
+    @param newKept List of integers The new fragments which survive
+    @return List of lists The matrix of the survivors, earlier ones first
+    '''
+    matrix = []
+    for a, i in enumerate(oldKept):
+        oldRow = oldMatrix[i]
+        matrix.append([int(oldRow[j]) for j in oldKept]
+                      + [oldRows[a][k] for k in newKept])
+    for k in newKept:
+        matrix.append([newRows[k][a] for a in range(numOld)]
+                      + [newRows[k][numOld + k2] for k2 in newKept])
+    return matrix
+
+def appendReads(newReads, storeFile=FRAGMENT_STORE_FILE):
+    '''
+    @param newReads List of strings The reads to add
+    @return Tuple (every fragment read so far, their filter flags, the surviving
+                   fragments, their overlap matrix, their offset matrix)
+    '''
+    fragments, flags, overlapMatrix, offsetMatrix = loadPreviousRun(storeFile)
+    numOld = len(fragments)
+    oldSurvivors = [i for i in range(numOld) if flags[i] == 0]
+
+    fragments = fragments + list(newReads)
+    flags = flags + [TOO_SHORT if len(f) <= scoring.MIN_LENGTH else 0 for f in newReads]
+    removeContainedReads(fragments, flags, numOld)
+
+    # Rows of the old matrices which still survive, and the new candidates
+    oldKept = [row for row, i in enumerate(oldSurvivors) if flags[i] == 0]
+    newCandidates = [i for i in range(numOld, len(fragments)) if flags[i] == 0]
+    oldFragments = [fragments[oldSurvivors[row]] for row in oldKept]
+    newFragments = [fragments[i] for i in newCandidates]
+    print("Comparing", len(newFragments), "new fragments against",
+          len(oldFragments), "earlier ones.")
+
+    newKept, (newRows, newOffsetRows), (oldRows, oldOffsetRows) = \
+        removeAntisenseReads(newFragments, oldFragments)
+    keptSet = set(newKept)
+    for k, i in enumerate(newCandidates):
+        if k not in keptSet:
+            flags[i] = ANTISENSE
+
+    numKeptOld = len(oldKept)
+    overlapMatrix = extendMatrix(overlapMatrix, oldKept, newRows, oldRows,
+                                 numKeptOld, newKept)
+    offsetMatrix = extendMatrix(offsetMatrix, oldKept, newOffsetRows, oldOffsetRows,
+                                numKeptOld, newKept)
+    survivors = oldFragments + [newFragments[k] for k in newKept]
+    return fragments, flags, survivors, overlapMatrix, offsetMatrix
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python3 team_3_appendReads.py <new reads.fasta>")
+        sys.exit(1)
+
+    if scoring.OVERLAP_CACHE_FILE is not None:
+        scoring.overlapCache = loadOverlapCache(scoring.OVERLAP_CACHE_FILE,
+                                                scoring.OVERLAP_CACHE_SIZE,
+                                                scoring.getOverlapCacheTag())
+
+    newReads = [sequence for label, header, sequence in iterfasta(sys.argv[1])]
+    fragments, flags, survivors, overlapMatrix, offsetMatrix = appendReads(newReads)
+    print("After adding", len(newReads), "reads, we have", len(survivors),
+          "fragments.")
+
+    writeMatrix("overlap.npy", overlapMatrix)
+    writeMatrix("offsets.npy", offsetMatrix)
+    if scoring.WRITE_TEXT_MATRICES:
+        writeTextMatrix("overlap.txt", overlapMatrix)
+        writeTextMatrix("offsets.txt", offsetMatrix)
+
+    fragmentFile = open("fragments.txt", "w")
+    for f in survivors:
+        fragmentFile.write(f)
+        fragmentFile.write("\n")
+    fragmentFile.close()
+
+    writeFragmentStore(FRAGMENT_STORE_FILE, fragments, flags, scoring.MIN_LENGTH)
+
+    if scoring.overlapCache is not None:
+        scoring.overlapCache.save(scoring.OVERLAP_CACHE_FILE)
+
+    print("\nWrote the output files. Now run the team_3_tsp.py program.")
+
+if __name__ == "__main__":
+    main()
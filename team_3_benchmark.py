@@ -0,0 +1,221 @@
+'''
+Times each stage of the assembly on a synthetic read set, so that changes to the
+code can be checked for performance regressions.
+
+The reads are drawn from a random genome at a chosen length, coverage and error
+rate (each base of a read is substituted with that probability), and some of them
+are reverse-complimented as if they came from the anti-sense strand. The stages
+timed are overlap() on single pairs, getOverlapMatrix() (also with each of the
+exact engines, "python" and "numpy"), getRevCompMatrix(),
+removeDuplicates(), the anti-sense pruning loop and the tour solver. Each is run
+a few times, and the fastest time is kept. The tour solver's local search is run
+without a time budget, until no move helps, so that its time measures how fast it
+converges rather than the budget.
+
+The results are printed as JSON (and optionally written to a file). Given a
+baseline written by an earlier run, the benchmark exits with status 1 if any
+stage got slower than the baseline by more than the threshold, or if the tour
+solver found a worse tour:
+    $ python3 team_3_benchmark.py --output baseline.json
+    $ python3 team_3_benchmark.py --baseline baseline.json --threshold 0.25
+
+Written for Python 3
+'''
+
+import argparse
+import contextlib
+import json
+import platform
+import random
+import sys
+import time
+
+import team_3_scoreAlignments as scoring
+import team_3_tourSolver
+
+# The defaults for the synthetic read set
+GENOME_LENGTH = 2000
+COVERAGE = 5
+ERROR_RATE = 0.01
+MIN_READ_LENGTH = 30
+MAX_READ_LENGTH = 60
+ANTISENSE_FRACTION = 0.1
+
+# How many times to run each stage (the fastest run counts)
+REPEATS = 3
+
+# How many pairs of reads to time overlap() on
+OVERLAP_PAIRS = 2000
+
+# How much slower than the baseline (as a fraction) a stage may get
+REGRESSION_THRESHOLD = 0.25
+
+def makeGenome(length, rng):
+    return "".join(rng.choice("ACGT") for i in range(length))
+
+def makeReads(genome, coverage, errorRate, rng, minReadLength=MIN_READ_LENGTH,
+              maxReadLength=MAX_READ_LENGTH, antisenseFraction=ANTISENSE_FRACTION):
+    '''
+    @return List of strings Reads drawn uniformly from the genome until the total
+            read length reaches coverage times the genome length
+    '''
+    reads = []
+    totalLength = 0
+    while totalLength < coverage * len(genome):
+        readLength = rng.randint(minReadLength, min(maxReadLength, len(genome)))
+        start = rng.randint(0, len(genome) - readLength)
+        read = [ rng.choice("ACGT".replace(base, "")) if rng.random() < errorRate
+                 else base for base in genome[start:start + readLength] ]
+        read = "".join(read)
+        if rng.random() < antisenseFraction:
+            read = scoring.getReverseCompliment(read)
+        reads.append(read)
+        totalLength += readLength
+    return reads
+
+def timeStage(function, repeats=REPEATS):
+    '''
+    @return Tuple (the fastest run time in seconds, the result of the last run)
+    '''
+    bestTime = None
+    for repeat in range(repeats):
+        startTime = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - startTime
+        if bestTime is None or elapsed < bestTime:
+            bestTime = elapsed
+    return bestTime, result
+
+def runBenchmarks(genomeLength=GENOME_LENGTH, coverage=COVERAGE, errorRate=ERROR_RATE,
+                  seed=0, repeats=REPEATS, engine=None):
+    '''
+    @param engine String The overlap() engine to use (default: OVERLAP_ENGINE)
+    @return Dictionary The "parameters" of the run, a description of the
+            "environment" and, for each stage, its fastest time in "seconds" and
+            the size of its input in "items"
+    '''
+    if engine is None:
+        engine = scoring.OVERLAP_ENGINE
+    rng = random.Random(seed)
+    reads = makeReads(makeGenome(genomeLength, rng), coverage, errorRate, rng)
+    fragments = [f for f in reads if len(f) > scoring.MIN_LENGTH]
+
+    # Time the overlap computations themselves, not the cache
+    savedCache = scoring.overlapCache
+    savedEngine = scoring.OVERLAP_ENGINE
+    scoring.overlapCache = None
+    scoring.OVERLAP_ENGINE = engine
+    stages = {}
+    # The stages print their progress; keep it out of the JSON on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            pairs = [(rng.choice(fragments), rng.choice(fragments))
+                     for i in range(OVERLAP_PAIRS)]
+            seconds, result = timeStage(lambda: [scoring.overlap(s1, s2) for s1, s2 in pairs],
+                                        repeats)
+            stages["overlap"] = { "seconds": seconds, "items": len(pairs) }
+
+            seconds, result = timeStage(lambda: scoring.getOverlapMatrix(fragments, workers=1),
+                                        repeats)
+            stages["overlapMatrix"] = { "seconds": seconds, "items": len(fragments) }
+
+            # Both exact engines on their own, to check that the numpy one is
+            # still the faster way to build the matrices
+            exactEngines = ["python"] + (["numpy"] if scoring.numpy is not None else [])
+            for exactEngine in exactEngines:
+                seconds, result = timeStage(lambda: scoring.getPairwiseMatrices(
+                    fragments, fragments, exactEngine, workers=1), repeats)
+                stages["overlapMatrix." + exactEngine] = { "seconds": seconds,
+                                                           "items": len(fragments) }
+
+            seconds, result = timeStage(lambda: scoring.getRevCompMatrix(fragments, workers=1),
+                                        repeats)
+            stages["revCompMatrix"] = { "seconds": seconds, "items": len(fragments) }
+
+            seconds, deduplicated = timeStage(lambda: scoring.removeDuplicates(fragments),
+                                              repeats)
+            stages["removeDuplicates"] = { "seconds": seconds, "items": len(fragments) }
+
+            seconds, result = timeStage(lambda: scoring.removeAntisenseFragments(deduplicated),
+                                        repeats)
+            survivors, overlapMatrix, offsetMatrix = result
+            stages["antisensePruning"] = { "seconds": seconds, "items": len(deduplicated) }
+
+            lengths = [len(f) for f in survivors]
+            seconds, result = timeStage(lambda: team_3_tourSolver.solveTour(
+                overlapMatrix, offsetMatrix, lengths, timeBudget=None), repeats)
+            stages["tourSolver"] = { "seconds": seconds, "items": len(survivors),
+                                     "score": result[0] }
+        finally:
+            scoring.overlapCache = savedCache
+            scoring.OVERLAP_ENGINE = savedEngine
+
+    return { "parameters": { "genomeLength": genomeLength, "coverage": coverage,
+                             "errorRate": errorRate, "seed": seed,
+                             "repeats": repeats, "engine": engine,
+                             "reads": len(reads) },
+             "environment": { "python": platform.python_version(),
+                              "numpy": scoring.numpy is not None,
+                              "machine": platform.machine() },
+             "stages": stages }
+
+def findRegressions(results, baseline, threshold=REGRESSION_THRESHOLD):
+    '''
+    @return List of strings A description of each stage which took more than
+            (1 + threshold) times as long as in the baseline, or whose score
+            (the length of the layout, for the tour solver) got worse
+    '''
+    regressions = []
+    for stage, timing in sorted(results["stages"].items()):
+        if stage not in baseline["stages"]:
+            continue
+        baselineSeconds = baseline["stages"][stage]["seconds"]
+        if timing["seconds"] > baselineSeconds * (1 + threshold):
+            regressions.append("%s took %.4f s, up from %.4f s"
+                               % (stage, timing["seconds"], baselineSeconds))
+        baselineScore = baseline["stages"][stage].get("score")
+        if baselineScore is not None and timing.get("score", baselineScore) > baselineScore:
+            regressions.append("%s scored %d, up from %d"
+                               % (stage, timing["score"], baselineScore))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each stage of the "
+                                     + "assembly on synthetic reads.")
+    parser.add_argument("--genome-length", type=int, default=GENOME_LENGTH)
+    parser.add_argument("--coverage", type=float, default=COVERAGE)
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--engine", default=None,
+                        help="the overlap() engine to use")
+    parser.add_argument("--output", default=None,
+                        help="also write the results to this JSON file")
+    parser.add_argument("--baseline", default=None,
+                        help="a JSON file from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="how much slower than the baseline (as a fraction) "
+                        + "a stage may get")
+    args = parser.parse_args()
+
+    results = runBenchmarks(args.genome_length, args.coverage, args.error_rate,
+                            args.seed, args.repeats, args.engine)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if args.output is not None:
+        with open(args.output, "w") as outfile:
+            json.dump(results, outfile, indent=2, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)
+        if baseline["parameters"] != results["parameters"]:
+            print("Warning: the baseline was run with different parameters",
+                  file=sys.stderr)
+        regressions = findRegressions(results, baseline, args.threshold)
+        for regression in regressions:
+            print("Regression:", regression, file=sys.stderr)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
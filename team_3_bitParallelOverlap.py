@@ -0,0 +1,206 @@
+'''
+An alternative overlap() scorer which allows insertions and deletions as well as
+substitutions, using Myers' bit-parallel approximate string matching algorithm
+(in the formulation of Hyyrö, "Explaining and extending the bit-parallel
+approximate string matching algorithm of Myers", 2001).
+
+The overlap of s1 and s2 is the longest prefix of s2 that aligns to some suffix
+of s1 with an edit distance of at most floor(errorRate * prefix length). Each
+column of the dynamic programming matrix is stored as two bit vectors (Python
+integers, so there's no limit on the fragment length), so each pair costs
+O(len(s1) * ceil(len(s2)/64)) word operations:
+  - a forward pass over s1 with s2 as the pattern, starting anywhere in s1 and
+    ending at its last character, gives the edit distance of every prefix of s2
+    against its best suffix of s1 at once, which decides the overlap length
+  - a backward pass over the reversed strings, anchored at the end of s1, finds
+    where in s1 that overlap starts
+
+Run this file to compare its scores against the original overlap() on a FASTA
+file:
+    $ python3 team_3_bitParallelOverlap.py fragments.fasta 200
+
+Written for Python 3
+'''
+
+import functools
+import sys
+import time
+
+# The default number of edits allowed per base of the overlap
+ERROR_RATE = 0.1
+
+@functools.lru_cache(maxsize=4096)
+def getPatternMasks(pattern):
+    '''
+    @return Dictionary mapping each character of the pattern to a bit mask of the
+            positions it occurs at (bit i for pattern[i])
+    '''
+    masks = {}
+    for i, character in enumerate(pattern):
+        masks[character] = masks.get(character, 0) | (1 << i)
+    return masks
+
+def getSuffixPrefixDistances(s1, s2):
+    '''
+    @return List of integers Entry k is the smallest edit distance between
+            s2[:k] and any suffix of s1 (for 0 <= k <= len(s2))
+    '''
+    m = len(s2)
+    if m == 0:
+        return [0]
+    mask = (1 << m) - 1
+    masks = getPatternMasks(s2)
+
+    # The vertical deltas of the current column: bit i of Pv (Mv) is set if
+    # D[i+1][j] - D[i][j] is +1 (-1). In the first column, D[i][0] = i.
+    Pv = mask
+    Mv = 0
+    for character in s1:
+        Eq = masks.get(character, 0)
+        Xv = Eq | Mv
+        Xh = (((Eq & Pv) + Pv) ^ Pv) | Eq
+        Ph = Mv | (~(Xh | Pv) & mask)
+        Mh = Pv & Xh
+        # The top row is all zeros (the alignment may start anywhere in s1), so
+        # no horizontal delta is carried into the first row
+        Ph = (Ph << 1) & mask
+        Mh = (Mh << 1) & mask
+        Pv = Mh | (~(Xv | Ph) & mask)
+        Mv = Ph & Xv
+
+    distances = [0] * (m + 1)
+    for i in range(m):
+        distances[i + 1] = distances[i] + ((Pv >> i) & 1) - ((Mv >> i) & 1)
+    return distances
+
+def getOverlapStart(s1, prefix, maxErrors):
+    '''
+    @param prefix String The prefix of s2 which overlaps the end of s1
+    @return Integer The index in s1 where the best alignment of the prefix
+            against a suffix of s1 starts. Among equally good alignments, the one
+            whose suffix is closest in length to the prefix wins.
+    '''
+    m = len(prefix)
+    mask = (1 << m) - 1
+    highBit = 1 << (m - 1)
+    masks = getPatternMasks(prefix[::-1])
+
+    # Align the reversed prefix against the reversed s1, both starting at their
+    # first character: D[i][0] = i and D[0][j] = j
+    Pv = mask
+    Mv = 0
+    score = m
+    bestLength = 0
+    bestKey = (score, m)
+    for j in range(len(s1)):
+        Eq = masks.get(s1[len(s1) - 1 - j], 0)
+        Xv = Eq | Mv
+        Xh = (((Eq & Pv) + Pv) ^ Pv) | Eq
+        Ph = Mv | (~(Xh | Pv) & mask)
+        Mh = Pv & Xh
+        if Ph & highBit:
+            score += 1
+        elif Mh & highBit:
+            score -= 1
+        # The top row increases by one per column
+        Ph = ((Ph << 1) | 1) & mask
+        Mh = (Mh << 1) & mask
+        Pv = Mh | (~(Xv | Ph) & mask)
+        Mv = Ph & Xv
+
+        key = (score, abs(j + 1 - m))
+        if key < bestKey:
+            bestKey = key
+            bestLength = j + 1
+        if j + 1 - m > maxErrors:
+            # Any longer suffix needs more deletions than we allow
+            break
+    return len(s1) - bestLength
+
+def overlapBitParallel( s1, s2, errorRate=ERROR_RATE ):
+    '''
+    @param errorRate Float The number of edits allowed per base of the overlap
+    @return Tuple (length of the overlap, index in s1 where the overlap starts),
+            or (0, len(s1)) if no prefix of s2 overlaps the end of s1
+    '''
+    if len(s1) == 0 or len(s2) == 0:
+        return 0, len(s1)
+
+    distances = getSuffixPrefixDistances(s1, s2)
+    for length in range(len(s2), 0, -1):
+        maxErrors = int(length * errorRate)
+        if distances[length] <= maxErrors:
+            return length, getOverlapStart(s1, s2[:length], maxErrors)
+    return 0, len(s1)
+
+def compareEngines(fragments, engines=("python", "bitparallel")):
+    '''
+    Scores every ordered pair of fragments with two overlap() engines.
+
+    @return Dictionary with the number of "pairs"; how many got the same score
+            ("same"), overlap under only the first or only the second engine
+            ("onlyFirst", "onlySecond") or overlap under both by different
+            amounts ("different"); the mean and largest absolute difference in
+            overlap length ("meanDifference", "maxDifference"); and each
+            engine's run time in seconds ("seconds")
+    '''
+    import team_3_scoreAlignments as scoring
+
+    scores = []
+    seconds = []
+    for engine in engines:
+        startTime = time.perf_counter()
+        overlapMatrix, offsetMatrix = scoring.getPairwiseMatrices(
+            fragments, fragments, engine, workers=1, cache=False)
+        seconds.append(time.perf_counter() - startTime)
+        scores.append(overlapMatrix)
+
+    stats = { "pairs": 0, "same": 0, "onlyFirst": 0, "onlySecond": 0,
+              "different": 0, "meanDifference": 0.0, "maxDifference": 0,
+              "seconds": dict(zip(engines, seconds)) }
+    totalDifference = 0
+    for i in range(len(fragments)):
+        for j in range(len(fragments)):
+            if i == j:
+                continue
+            first, second = scores[0][i][j], scores[1][i][j]
+            stats["pairs"] += 1
+            if first == second:
+                stats["same"] += 1
+            elif second == 0:
+                stats["onlyFirst"] += 1
+            elif first == 0:
+                stats["onlySecond"] += 1
+            else:
+                stats["different"] += 1
+            totalDifference += abs(first - second)
+            stats["maxDifference"] = max(stats["maxDifference"], abs(first - second))
+    stats["meanDifference"] = float(totalDifference) / max(1, stats["pairs"])
+    return stats
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python3 team_3_bitParallelOverlap.py <fragments.fasta> "
+              + "[number of fragments to compare]")
+        sys.exit(1)
+
+    import team_3_scoreAlignments as scoring
+    fragments = scoring.getFragments(sys.argv[1])
+    if len(sys.argv) > 2:
+        fragments = fragments[:int(sys.argv[2])]
+
+    stats = compareEngines(fragments)
+    print("Compared", stats["pairs"], "pairs of fragments:")
+    rows = [ ("same score", stats["same"]),
+             ("overlap only with python", stats["onlyFirst"]),
+             ("overlap only with bitparallel", stats["onlySecond"]),
+             ("overlap with both, differing", stats["different"]),
+             ("mean length difference", "%.3f" % stats["meanDifference"]),
+             ("max length difference", stats["maxDifference"]) ]
+    rows.extend(("%s run time (s)" % engine, "%.3f" % seconds)
+                for engine, seconds in stats["seconds"].items())
+    for label, value in rows:
+        print("  %-32s %s" % (label, value))
+
+if __name__ == "__main__":
+    main()
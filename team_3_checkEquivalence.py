@@ -0,0 +1,144 @@
+'''
+Checks that the faster code paths give the same results as the simpler ones they
+replaced, on synthetic read sets like the benchmark's (see team_3_benchmark.py):
+  - removeAntisenseFragments() with incremental pruning, against the original
+    loop which rebuilds the matrices on every pass
+  - team_3_containment.getContainedFragmentIndices(), against a substring test
+    between every pair of fragments (with some substrings and exact duplicates
+    of the reads added, so that there is something to find)
+
+Each check is run on a few read sets drawn with different seeds. A description
+of every difference found is printed, and the script exits with status 1 if
+there were any:
+    $ python3 team_3_checkEquivalence.py --trials 5
+
+Written for Python 3
+'''
+
+import argparse
+import contextlib
+import random
+import sys
+
+import team_3_scoreAlignments as scoring
+from team_3_benchmark import makeGenome, makeReads
+from team_3_containment import getContainedFragmentIndices
+
+# The defaults for the synthetic read sets; smaller than the benchmark's, since
+# the original pruning loop rebuilds the matrices on every pass
+GENOME_LENGTH = 600
+COVERAGE = 5
+ERROR_RATE = 0.01
+
+# How many read sets to check
+TRIALS = 3
+
+# How many substrings and exact duplicates of the reads to add for the
+# containment check
+NUM_CONTAINED = 20
+
+# The numbers of pruning passes to compare the two pruning loops over
+PRUNING_ITERATIONS = (1, 4)
+
+def toLists(matrix):
+    ''' @return The matrix (a list of lists or a NumPy array) as a list of lists '''
+    return [[int(value) for value in row] for row in matrix]
+
+def addContainedFragments(fragments, rng, numContained=NUM_CONTAINED):
+    '''
+    @return List of strings The fragments, with substrings and copies of some of
+            them inserted at random positions
+    '''
+    fragments = list(fragments)
+    for k in range(numContained):
+        source = rng.choice(fragments)
+        if k % 2 == 0:
+            length = rng.randint(1, len(source))
+            start = rng.randint(0, len(source) - length)
+            source = source[start:start + length]
+        fragments.insert(rng.randint(0, len(fragments)), source)
+    return fragments
+
+def checkContainment(fragments):
+    '''
+    @return List of strings A description of each difference between
+            getContainedFragmentIndices() and the pairwise substring test
+    '''
+    expected = set(i for i in range(len(fragments))
+                   if any(fragments[i] in fragments[j] for j in range(len(fragments))
+                          if j != i))
+    found = getContainedFragmentIndices(fragments)
+    return [ "fragment %d was %s" % (i, "missed" if i in expected
+                                     else "wrongly reported as contained")
+             for i in sorted(expected ^ found) ]
+
+def checkAntisensePruning(fragments, iterations=PRUNING_ITERATIONS):
+    '''
+    @param fragments List of strings The fragments, with duplicates removed
+    @return List of strings A description of each difference between the
+            incremental and the original pruning
+    '''
+    problems = []
+    for maxIterations in iterations:
+        expected = scoring.removeAntisenseFragments(fragments, incremental=False,
+                                                    maxIterations=maxIterations)
+        found = scoring.removeAntisenseFragments(fragments, incremental=True,
+                                                 maxIterations=maxIterations)
+        if found[0] != expected[0]:
+            problems.append("after %d passes, incremental pruning kept %d fragments "
+                            "rather than %d" % (maxIterations, len(found[0]),
+                                                len(expected[0])))
+            continue
+        for name, k in (("overlap", 1), ("offset", 2)):
+            if toLists(found[k]) != toLists(expected[k]):
+                problems.append("after %d passes, incremental pruning gave a "
+                                "different %s matrix" % (maxIterations, name))
+    return problems
+
+def runChecks(genomeLength=GENOME_LENGTH, coverage=COVERAGE, errorRate=ERROR_RATE,
+              seed=0, trials=TRIALS):
+    '''
+    @return List of strings A description of each difference found
+    '''
+    savedCache = scoring.overlapCache
+    scoring.overlapCache = None
+    problems = []
+    # The stages print their progress; keep it apart from the results
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            for trial in range(trials):
+                rng = random.Random(seed + trial)
+                reads = makeReads(makeGenome(genomeLength, rng), coverage, errorRate,
+                                  rng)
+                fragments = [f for f in reads if len(f) > scoring.MIN_LENGTH]
+                deduplicated = scoring.removeDuplicates(fragments)
+
+                for problem in checkContainment(addContainedFragments(fragments, rng)):
+                    problems.append("seed %d: %s" % (seed + trial, problem))
+
+                for problem in checkAntisensePruning(deduplicated):
+                    problems.append("seed %d: %s" % (seed + trial, problem))
+        finally:
+            scoring.overlapCache = savedCache
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the fast code paths "
+                                     + "agree with the original ones.")
+    parser.add_argument("--genome-length", type=int, default=GENOME_LENGTH)
+    parser.add_argument("--coverage", type=float, default=COVERAGE)
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trials", type=int, default=TRIALS)
+    args = parser.parse_args()
+
+    problems = runChecks(args.genome_length, args.coverage, args.error_rate,
+                         args.seed, args.trials)
+    for problem in problems:
+        print("Mismatch:", problem)
+    if len(problems) > 0:
+        sys.exit(1)
+    print("All", args.trials, "read sets agree.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+'''
+Builds the assembled sequence from the fragments, the order team_3_tsp.py found
+and the offsets team_3_scoreAlignments.py computed, replacing the step of fixing
+the layout up by hand in a spreadsheet.
+
+The fragments are stacked at their offsets, exactly as
+team_3_prettyPrintTSPAlignments.py lays them out, and every column of the layout
+is decided by a majority vote (ties go to the base that comes first in "ACGT").
+Wherever two neighboring fragments don't overlap at all, the layout is split
+into separate contigs.
+
+The contigs are written to consensus.fasta, and the coverage (how many fragments
+cover each position) and disagreements (how many of them don't match the
+consensus base) of each position to consensus.tsv.
+
+Relies on you first having run team_3_tsp.py in the current working directory.
+
+Written for Python 3
+'''
+
+import os
+
+from team_3_fragmentStore import FRAGMENT_STORE_FILE, readFragments
+from team_3_matrixIO import findMatrixFile, loadMatrix
+from team_3_prettyPrintTSPAlignments import readAlignmentOrder
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+BASES = "ACGT"
+
+# The number of bases per line in the FASTA output
+FASTA_LINE_LENGTH = 60
+
+BASE_CODES = bytes.maketrans(b"ACGT", b"\x00\x01\x02\x03")
+
+def getContigs(fragments, order, offsetMatrix):
+    '''
+    Lays the fragments out in the order given, splitting the layout wherever a
+    fragment doesn't overlap the one before it.
+
+    @return List of lists Each contig, as a list of (fragment index, start)
+            pairs, with the first fragment of each contig starting at 0
+    '''
+    contigs = []
+    contig = []
+    start = 0
+    for k, i in enumerate(order):
+        if k > 0:
+            offset = int(offsetMatrix[order[k - 1]][i])
+            if offset >= len(fragments[order[k - 1]]):
+                contigs.append(contig)
+                contig = []
+                start = 0
+            else:
+                start += offset
+        contig.append((i, start))
+    if len(contig) > 0:
+        contigs.append(contig)
+    return contigs
+
+def getPileup(fragments, contig):
+    '''
+    @param contig List of (fragment index, start) pairs, from getContigs()
+    @return The number of times each base was seen at each position of the
+            contig: a NumPy array with one row per position and one column per
+            base in BASES (or, without NumPy, a list of 4-element lists). Bases
+            other than A, C, G and T aren't counted.
+    '''
+    length = max(start + len(fragments[i]) for i, start in contig)
+    if numpy is not None:
+        counts = numpy.zeros((length, len(BASES)), dtype=numpy.int32)
+        for i, start in contig:
+            codes = numpy.frombuffer(fragments[i].encode("ascii").translate(BASE_CODES),
+                                     dtype=numpy.uint8)
+            positions = numpy.arange(start, start + len(codes))
+            known = codes < len(BASES)
+            # Each position appears at most once per fragment, so a plain
+            # fancy-indexed increment counts correctly
+            counts[positions[known], codes[known]] += 1
+        return counts
+
+    counts = [[0] * len(BASES) for position in range(length)]
+    for i, start in contig:
+        for position, code in enumerate(fragments[i].encode("ascii").translate(BASE_CODES)):
+            if code < len(BASES):
+                counts[start + position][code] += 1
+    return counts
+
+def getConsensus(counts):
+    '''
+    @param counts The pileup, as returned by getPileup()
+    @return Tuple (consensus sequence, list of the coverage of each position,
+                   list of the number of disagreeing bases at each position).
+            Positions no base was counted at are called "N".
+    '''
+    if numpy is not None:
+        counts = numpy.asarray(counts)
+        winners = counts.argmax(axis=1)
+        coverage = counts.sum(axis=1)
+        disagreements = coverage - counts.max(axis=1)
+        sequence = "".join("N" if covered == 0 else BASES[winner]
+                           for winner, covered in zip(winners.tolist(), coverage.tolist()))
+        return sequence, coverage.tolist(), disagreements.tolist()
+
+    sequence = []
+    coverage = []
+    disagreements = []
+    for column in counts:
+        best = max(column)
+        covered = sum(column)
+        sequence.append("N" if covered == 0 else BASES[column.index(best)])
+        coverage.append(covered)
+        disagreements.append(covered - best)
+    return "".join(sequence), coverage, disagreements
+
+def buildConsensus(fragments, order, offsetMatrix):
+    '''
+    @param fragments List of strings The fragments the order refers to
+    @param order List of integers The order to lay the fragments out in
+    @param offsetMatrix Matrix Entry [i][j] is where fragment j starts relative
+                               to the start of fragment i when j follows i
+    @return List of tuples (sequence, coverage, disagreements, number of
+            fragments) for each contig, as returned by getConsensus()
+    '''
+    results = []
+    for contig in getContigs(fragments, order, offsetMatrix):
+        sequence, coverage, disagreements = getConsensus(getPileup(fragments, contig))
+        results.append((sequence, coverage, disagreements, len(contig)))
+    return results
+
+def writeConsensusFasta(fileName, contigs):
+    ''' Writes each contig from buildConsensus() as a FASTA record '''
+    fastaFile = open(fileName, "w")
+    for number, (sequence, coverage, disagreements, numFragments) in enumerate(contigs):
+        meanCoverage = float(sum(coverage)) / max(1, len(sequence))
+        fastaFile.write(">contig%d length=%d fragments=%d mean_coverage=%.2f "
+                        "disagreements=%d\n" % (number + 1, len(sequence), numFragments,
+                                                meanCoverage, sum(disagreements)))
+        for start in range(0, len(sequence), FASTA_LINE_LENGTH):
+            fastaFile.write(sequence[start:start + FASTA_LINE_LENGTH] + "\n")
+    fastaFile.close()
+
+def writeCoverageTable(fileName, contigs):
+    '''
+    Writes one tab-separated line per position of each contig from
+    buildConsensus(): the contig, position, base, coverage and disagreements
+    '''
+    tableFile = open(fileName, "w")
+    tableFile.write("contig\tposition\tbase\tcoverage\tdisagreements\n")
+    for number, (sequence, coverage, disagreements, numFragments) in enumerate(contigs):
+        name = "contig%d" % (number + 1)
+        tableFile.write("".join("%s\t%d\t%s\t%d\t%d\n" % (name, position + 1, base,
+                                                          covered, disagreed)
+                                for position, (base, covered, disagreed)
+                                in enumerate(zip(sequence, coverage, disagreements))))
+    tableFile.close()
+
+def main():
+    if os.path.exists(FRAGMENT_STORE_FILE):
+        fragments = readFragments(FRAGMENT_STORE_FILE)
+    else:
+        fragments = readFragments('fragments.txt')
+    offsetMatrix = loadMatrix(findMatrixFile('offsets'))
+    order = readAlignmentOrder("alignmentOrder.txt")
+
+    contigs = buildConsensus(fragments, order, offsetMatrix)
+    writeConsensusFasta("consensus.fasta", contigs)
+    writeCoverageTable("consensus.tsv", contigs)
+
+    for number, (sequence, coverage, disagreements, numFragments) in enumerate(contigs):
+        print("contig%d:" % (number + 1), len(sequence), "bases from", numFragments,
+              "fragments,", sum(disagreements), "disagreeing bases")
+    print("Wrote consensus.fasta and consensus.tsv")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+'''
+Finds every fragment that is contained in another fragment using an Aho-Corasick
+automaton over all the fragments, so that removing duplicated content takes time
+roughly linear in the total length of the fragments rather than quadratic in
+their number.
+
+Written for Python 3
+'''
+
+from collections import Counter
+
+def buildAhoCorasick(patterns):
+    '''
+    @param patterns List of strings The (distinct, non-empty) patterns to index
+    @return Tuple (goto, fail, outLink, patternAt, depth). goto[n] maps a letter to
+            the child of node n; fail[n] is the node for the longest proper suffix
+            of n's string that is in the trie; outLink[n] is the nearest node on
+            n's fail chain that ends a pattern (or -1); patternAt[n] is the index
+            of the pattern ending at n (or -1); depth[n] is the length of n's
+            string.
+    '''
+    goto = [{}]
+    patternAt = [-1]
+    depth = [0]
+    for patternIndex, pattern in enumerate(patterns):
+        node = 0
+        for letter in pattern:
+            child = goto[node].get(letter)
+            if child is None:
+                child = len(goto)
+                goto[node][letter] = child
+                goto.append({})
+                patternAt.append(-1)
+                depth.append(depth[node] + 1)
+            node = child
+        patternAt[node] = patternIndex
+
+    # Breadth-first, so that every node's fail link is known before its children's
+    fail = [0] * len(goto)
+    outLink = [-1] * len(goto)
+    queue = list(goto[0].values())
+    for node in queue:
+        for letter, child in goto[node].items():
+            queue.append(child)
+            state = fail[node]
+            while state != 0 and letter not in goto[state]:
+                state = fail[state]
+            target = goto[state].get(letter, 0)
+            fail[child] = target if target != child else 0
+            outLink[child] = fail[child] if patternAt[fail[child]] != -1 \
+                             else outLink[fail[child]]
+    return goto, fail, outLink, patternAt, depth
+
+def getContainedFragmentIndices(fragments):
+    '''
+    @param fragments List of strings The DNA sequences to check
+    @return Set of integers The indices i for which fragments[i] is in
+            fragments[j] for some j != i. Note that this includes every copy of a
+            fragment which appears more than once.
+    '''
+    counts = Counter(fragments)
+    distinct = [f for f in counts if f != '']
+    goto, fail, outLink, patternAt, depth = buildAhoCorasick(distinct)
+
+    found = [False] * len(distinct)
+    # Once a node has been reached, every pattern on its output chain has been
+    # found, so later scans can stop walking the chain there
+    reported = [False] * len(goto)
+    for text in distinct:
+        node = 0
+        for letter in text:
+            while node != 0 and letter not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(letter, 0)
+
+            match = node if patternAt[node] != -1 else outLink[node]
+            while match != -1 and not reported[match]:
+                # The text matching itself doesn't count as containment
+                if depth[match] != len(text):
+                    reported[match] = True
+                    found[patternAt[match]] = True
+                match = outLink[match]
+
+    contained = set(f for f, wasFound in zip(distinct, found) if wasFound)
+    contained.update(f for f, count in counts.items() if count > 1)
+    if '' in counts and len(fragments) > 1:
+        contained.add('')
+    return set(i for i, f in enumerate(fragments) if f in contained)
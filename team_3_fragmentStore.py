@@ -0,0 +1,257 @@
+'''
+A compact binary container for fragments, so that each stage of the pipeline can
+memory-map the fragments instead of re-parsing (and re-filtering) text files.
+
+The file is laid out as follows (all integers little-endian):
+  - header: the magic string "HAPFRAG1", then the format version (uint32), the
+    MIN_LENGTH the filters were run with (uint32), the number of fragments N
+    (uint64) and whether the filters were run at all (uint8, then 7 bytes of
+    padding)
+  - N uint32 fragment lengths
+  - N+1 uint64 byte offsets of each fragment's packed bases (the last one is the
+    total size of the packed data)
+  - N uint8 filter flags (see TOO_SHORT, CONTAINED and ANTISENSE)
+  - N uint8 encodings (see PACKED and RAW; version 2 only, version 1 stores are
+    all PACKED)
+  - the bases of each fragment, each starting on a byte boundary: PACKED
+    fragments have 2 bits per base (A=0, C=1, G=2, T=3), 4 bases per byte,
+    first base in the low bits; RAW fragments, which have letters other than A,
+    C, G and T (e.g. N, or lower case), have one byte per letter
+
+Run this file to convert a FASTA file (which is then filtered the same way as
+team_3_scoreAlignments.py does it) or a fragments.txt file (whose fragments are
+taken to be filtered already):
+    $ python3 team_3_fragmentStore.py fragments.fasta fragments.store
+
+Written for Python 3
+'''
+
+import array
+import mmap
+import struct
+import sys
+
+from readfasta import iterSequences, openSequenceFile
+
+MAGIC = b"HAPFRAG1"
+VERSION = 2
+HEADER = struct.Struct("<8sIIQB7x")
+
+# The name of the store written by team_3_scoreAlignments.py
+FRAGMENT_STORE_FILE = "fragments.store"
+
+# Filter flags. A fragment survives filtering if none of them is set.
+TOO_SHORT = 1  # no longer than MIN_LENGTH
+CONTAINED = 2  # contained in (or a duplicate of) another fragment
+ANTISENSE = 4  # fits better on the anti-sense strand
+
+# How a fragment's bases are stored
+PACKED = 0
+RAW = 1
+
+ENCODE_TABLE = bytes.maketrans(b"ACGT", b"\x00\x01\x02\x03")
+DECODE_TABLE = [ "".join("ACGT"[(byte >> shift) & 3] for shift in (0, 2, 4, 6))
+                 for byte in range(256) ]
+
+def packSequence(sequence):
+    '''
+    @param sequence String The DNA sequence to pack
+    @return Bytes The sequence packed 4 bases per byte
+    '''
+    codes = sequence.encode("ascii")
+    if codes.translate(None, b"ACGT") != b"":
+        raise ValueError("Only A, C, G and T can be stored in a fragment store")
+    codes = codes.translate(ENCODE_TABLE) + b"\x00" * (-len(codes) % 4)
+    return bytes(codes[i] | (codes[i+1] << 2) | (codes[i+2] << 4) | (codes[i+3] << 6)
+                 for i in range(0, len(codes), 4))
+
+def encodeSequence(sequence):
+    '''
+    @param sequence String The fragment to store
+    @return Tuple (PACKED or RAW, the bytes to store)
+    '''
+    codes = sequence.encode("latin1")
+    if codes.translate(None, b"ACGT") != b"":
+        return RAW, codes
+    return PACKED, packSequence(sequence)
+
+def unpackSequence(packed, length):
+    '''
+    @param packed Bytes-like The packed bases, as returned by packSequence()
+    @param length Integer The number of bases to unpack
+    @return String The DNA sequence
+    '''
+    return "".join([DECODE_TABLE[byte] for byte in packed])[:length]
+
+def readLittleEndianArray(typecode, data):
+    values = array.array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+def writeLittleEndianArray(outfile, typecode, values):
+    values = array.array(typecode, values)
+    if sys.byteorder != "little":
+        values.byteswap()
+    outfile.write(values.tobytes())
+
+def getFilterFlags(sequences, minLength, deduplicated=None, survivors=None):
+    '''
+    @param sequences List of strings Every fragment that was read
+    @param minLength Integer Fragments no longer than this are flagged TOO_SHORT
+    @param deduplicated List of strings The fragments left after removing
+                                        duplicated content (if known)
+    @param survivors List of strings The fragments left after removing anti-sense
+                                     fragments as well (if known)
+    @return List of integers The filter flags for each of the sequences
+    '''
+    deduplicated = None if deduplicated is None else set(deduplicated)
+    survivors = None if survivors is None else set(survivors)
+    flags = []
+    for sequence in sequences:
+        if len(sequence) <= minLength:
+            flags.append(TOO_SHORT)
+        elif deduplicated is not None and sequence not in deduplicated:
+            flags.append(CONTAINED)
+        elif survivors is not None and sequence not in survivors:
+            flags.append(ANTISENSE)
+        else:
+            flags.append(0)
+    return flags
+
+def writeFragmentStore(filename, sequences, flags=None, minLength=0):
+    '''
+    @param filename String The store to write
+    @param sequences List of strings The fragments to store
+    @param flags List of integers The filter flags of each fragment; None means
+                                  the filters haven't been run
+    @param minLength Integer The MIN_LENGTH the filters were run with
+    '''
+    encodings, packed = zip(*[encodeSequence(s) for s in sequences]) \
+                        if len(sequences) > 0 else ((), ())
+    offsets = [0]
+    for p in packed:
+        offsets.append(offsets[-1] + len(p))
+
+    with open(filename, "wb") as outfile:
+        outfile.write(HEADER.pack(MAGIC, VERSION, minLength, len(sequences),
+                                  0 if flags is None else 1))
+        writeLittleEndianArray(outfile, "I", [len(s) for s in sequences])
+        writeLittleEndianArray(outfile, "Q", offsets)
+        outfile.write(bytes([0] * len(sequences) if flags is None else flags))
+        outfile.write(bytes(encodings))
+        for p in packed:
+            outfile.write(p)
+
+class FragmentStore:
+    '''
+    A fragment store opened with mmap. Indexing it unpacks a single fragment;
+    nothing else is decoded until it's asked for.
+    '''
+
+    def __init__(self, filename):
+        with open(filename, "rb") as infile:
+            self.data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.minLength, count, filtered = \
+            HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError(filename + " is not a fragment store")
+        self.filtered = bool(filtered)
+
+        position = HEADER.size
+        self.lengths = readLittleEndianArray("I", self.data[position:position + 4*count])
+        position += 4 * count
+        self.offsets = readLittleEndianArray("Q", self.data[position:position + 8*(count + 1)])
+        position += 8 * (count + 1)
+        self.flags = self.data[position:position + count]
+        position += count
+        self.encodings = None
+        if version >= 2:
+            self.encodings = self.data[position:position + count]
+            position += count
+        self.dataStart = position
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, i):
+        start = self.dataStart + self.offsets[i]
+        end = self.dataStart + self.offsets[i + 1]
+        if self.encodings is not None and self.encodings[i] == RAW:
+            return self.data[start:end].decode("latin1")
+        return unpackSequence(self.data[start:end], self.lengths[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def getSurvivors(self):
+        '''
+        @return List of strings The fragments which passed every filter (or all
+                of them if the filters haven't been run)
+        '''
+        return [self[i] for i in range(len(self)) if self.flags[i] == 0]
+
+    def close(self):
+        self.data.close()
+
+def isFragmentStore(filename):
+    with open(filename, "rb") as infile:
+        return infile.read(len(MAGIC)) == MAGIC
+
+def readFragments(filename):
+    '''
+    @param filename String A fragment store, FASTA file or fragments.txt file
+    @return List of strings The fragments. For a fragment store, only the ones
+            which passed its filters.
+    '''
+    if isFragmentStore(filename):
+        store = FragmentStore(filename)
+        fragments = store.getSurvivors()
+        store.close()
+        return fragments
+    return list(iterSequences(filename))
+
+def convertFasta(fastaFile, storeFile):
+    '''
+    Converts a FASTA file to a fragment store, running the same filters as
+    team_3_scoreAlignments.main().
+    '''
+    import team_3_scoreAlignments as scoring
+    sequences = list(iterSequences(fastaFile))
+    longEnough = [s for s in sequences if len(s) > scoring.MIN_LENGTH]
+    deduplicated = scoring.removeDuplicates(longEnough)
+    survivors, overlapMatrix, offsetMatrix = \
+        scoring.removeAntisenseFragments(deduplicated)
+    writeFragmentStore(storeFile, sequences,
+                       getFilterFlags(sequences, scoring.MIN_LENGTH,
+                                      deduplicated, survivors),
+                       scoring.MIN_LENGTH)
+
+def convertFragmentList(textFile, storeFile):
+    '''
+    Converts a file with one (already filtered) fragment per line, like
+    fragments.txt, to a fragment store.
+    '''
+    sequences = list(iterSequences(textFile))
+    writeFragmentStore(storeFile, sequences, [0] * len(sequences))
+
+def main():
+    if len(sys.argv) != 3:
+        print("Usage: python3 team_3_fragmentStore.py <fragments.fasta or "
+              + "fragments.txt> <output store>")
+        sys.exit(1)
+
+    inputFile, storeFile = sys.argv[1], sys.argv[2]
+    with openSequenceFile(inputFile) as infile:
+        isFasta = infile.read(4096).lstrip()[:1] == ">"
+    if isFasta:
+        convertFasta(inputFile, storeFile)
+    else:
+        convertFragmentList(inputFile, storeFile)
+    print("Wrote", storeFile)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+'''
+Opt-in instrumentation for the assembly: event counters (e.g. overlap() calls and
+the character comparisons they make) and the wall-clock time, CPU time and peak
+memory of each stage (parsing, removing duplicates, each anti-sense pruning
+iteration, building the matrices, ordering the fragments).
+
+It's off by default, and then every hook returns straight away. Turn it on by
+setting the HAPLOTYPE_INSTRUMENT environment variable (or by calling enable(), as
+team_3_pipeline.py --instrument does):
+    $ HAPLOTYPE_INSTRUMENT=1 python3 team_3_scoreAlignments.py
+When the program exits, a JSON report is written to the file named by
+HAPLOTYPE_INSTRUMENT_REPORT (default: instrumentation.json). If
+HAPLOTYPE_PROFILE names a file, the whole run is also profiled with cProfile and
+the statistics dumped there, to be read with pstats.
+
+Only the main process is instrumented; work done by worker processes shows up in
+the time of the stage that waited for it, but not in the counters.
+
+Written for Python 3
+'''
+
+import atexit
+import contextlib
+import cProfile
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+REPORT_FILE = "instrumentation.json"
+
+ENABLED = False
+
+_counters = {}
+_stages = {}
+_stageOrder = []
+_openStages = []
+_profiler = None
+_profileFile = None
+_reportFile = REPORT_FILE
+_startTime = None
+
+def getPeakMemory():
+    '''
+    @return Integer The peak resident set size of this process so far, in
+            kilobytes (or None where the resource module isn't available)
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    if sys.platform == "darwin":
+        peak //= 1024
+    return peak
+
+def enable(reportFile=None, profileFile=None):
+    '''
+    Turns instrumentation on, and arranges for the report (and the profile, if a
+    file is given for it) to be written when the program exits.
+    '''
+    global ENABLED, _profiler, _profileFile, _reportFile, _startTime
+    if ENABLED:
+        return
+    ENABLED = True
+    _startTime = time.perf_counter()
+    if reportFile is not None:
+        _reportFile = reportFile
+    if profileFile is not None:
+        _profileFile = profileFile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    atexit.register(finish)
+
+def count(name, amount=1):
+    ''' Adds the amount to the named counter '''
+    if ENABLED:
+        _counters[name] = _counters.get(name, 0) + amount
+
+class Stage:
+    ''' Times the code in a with-block, and records it under the stage's name '''
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        _openStages.append(self.name)
+        self.wallStart = time.perf_counter()
+        self.cpuStart = time.process_time()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        wall = time.perf_counter() - self.wallStart
+        cpu = time.process_time() - self.cpuStart
+        _openStages.pop()
+        record = _stages.get(self.name)
+        if record is None:
+            record = { "calls": 0, "wallSeconds": 0.0, "cpuSeconds": 0.0,
+                       "peakMemoryKB": None, "parent": _openStages[-1]
+                       if len(_openStages) > 0 else None }
+            _stages[self.name] = record
+            _stageOrder.append(self.name)
+        record["calls"] += 1
+        record["wallSeconds"] += wall
+        record["cpuSeconds"] += cpu
+        record["peakMemoryKB"] = getPeakMemory()
+        return False
+
+_NOT_RECORDING = contextlib.nullcontext()
+
+def stage(name):
+    '''
+    @return A context manager which records the time and peak memory of the code
+            it wraps as the named stage (if instrumentation is enabled)
+    '''
+    if ENABLED:
+        return Stage(name)
+    return _NOT_RECORDING
+
+def timed(name):
+    '''
+    A decorator which records each call of the function as the named stage (if
+    instrumentation is enabled when it's called)
+    '''
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            with Stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def getReport():
+    '''
+    @return Dictionary The "counters", and the "stages" in the order they first
+            finished, each with its number of "calls", total "wallSeconds" and
+            "cpuSeconds", the process's "peakMemoryKB" when it last finished and
+            the stage it ran inside of ("parent")
+    '''
+    return { "totalWallSeconds": None if _startTime is None
+                                 else time.perf_counter() - _startTime,
+             "peakMemoryKB": getPeakMemory(),
+             "counters": dict(sorted(_counters.items())),
+             "stages": [dict(name=name, **_stages[name]) for name in _stageOrder] }
+
+def writeReport(filename):
+    with open(filename, "w") as outfile:
+        json.dump(getReport(), outfile, indent=2)
+
+def finish():
+    '''
+    Writes the report and the profile (if profiling). Called automatically when
+    the program exits.
+    '''
+    global _profiler
+    if not ENABLED or multiprocessing.parent_process() is not None:
+        return
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(_profileFile)
+        _profiler = None
+    writeReport(_reportFile)
+
+if os.environ.get("HAPLOTYPE_INSTRUMENT", "") not in ("", "0"):
+    enable(os.environ.get("HAPLOTYPE_INSTRUMENT_REPORT"),
+           os.environ.get("HAPLOTYPE_PROFILE") or None)
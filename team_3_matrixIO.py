@@ -0,0 +1,143 @@
+"""
+Reads and writes the overlap and offset matrices as binary .npy files, which the
+later stages memory-map instead of parsing a text file. The legacy text format
+(one space-separated row per line, as in overlap.txt) can still be read.
+
+Writing a .npy file doesn't require NumPy. Reading one uses numpy.load() with
+mmap_mode="r" when NumPy is available, and otherwise maps the file directly
+(Python 3 only).
+
+Written for Python 3 (the NumPy code paths also work in Python 2)
+"""
+
+import array
+import ast
+import mmap
+import os
+import struct
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NPY_MAGIC = b"\x93NUMPY"
+
+# The element type of the matrices we write: little-endian 32-bit integers
+NPY_DESCR = "<i4"
+
+def findMatrixFile(baseName):
+    """
+    @param baseName String The matrix file name without an extension (e.g.
+                           "overlap")
+    @return String The .npy file if there is one, or else the legacy .txt file
+    """
+    if os.path.exists(baseName + ".npy"):
+        return baseName + ".npy"
+    return baseName + ".txt"
+
+def writeMatrix(fileName, matrix):
+    """
+    Writes a matrix (a list of equal-length rows, or a 2-D NumPy array) of
+    integers to a version 1.0 .npy file.
+    """
+    numRows = len(matrix)
+    numCols = len(matrix[0]) if numRows > 0 else 0
+    writeMatrixRows(fileName, matrix, numRows, numCols)
+
+def writeMatrixRows(fileName, rows, numRows, numCols):
+    """
+    Like writeMatrix(), but takes the rows from any iterable (e.g. a generator),
+    so that the whole matrix never has to be in memory at once.
+
+    @param numRows Integer The number of rows the iterable yields
+    @param numCols Integer The length of each row
+    """
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d, %d), }" \
+             % (NPY_DESCR, numRows, numCols)
+    # The header (including the magic string, version and length fields, and
+    # the terminating newline) is padded with spaces to a multiple of 64 bytes
+    header += " " * (-(len(NPY_MAGIC) + 4 + len(header) + 1) % 64) + "\n"
+
+    matrixFile = open(fileName, "wb")
+    matrixFile.write(NPY_MAGIC + b"\x01\x00")
+    matrixFile.write(struct.pack("<H", len(header)))
+    matrixFile.write(header.encode("latin1"))
+    for row in rows:
+        values = array.array("i", [int(val) for val in row])
+        if sys.byteorder != "little":
+            values.byteswap()
+        matrixFile.write(values.tobytes())
+    matrixFile.close()
+
+def writeTextMatrix(fileName, matrix):
+    """ Writes the legacy text format: one row per line, separated by spaces """
+    matrixFile = open(fileName, "w")
+    for row in matrix:
+        for col in row:
+            matrixFile.write(str(col))
+            matrixFile.write(" ")
+        matrixFile.write("\n")
+    matrixFile.close()
+
+def isNpyFile(fileName):
+    matrixFile = open(fileName, "rb")
+    magic = matrixFile.read(len(NPY_MAGIC))
+    matrixFile.close()
+    return magic == NPY_MAGIC
+
+def readTextMatrix(fileName):
+    """ Reads the legacy text format: one row per line, separated by spaces """
+    matrix = []
+    matrixFile = open(fileName, "r")
+    for line in matrixFile:
+        row = [int(val) for val in line.split()]
+        if len(row) != 0:
+            matrix.append(row)
+    matrixFile.close()
+    return matrix
+
+def readNpyHeader(data):
+    """
+    @param data Bytes-like The start of a .npy file
+    @return Tuple (header dictionary, offset of the data)
+    """
+    major = data[len(NPY_MAGIC)]
+    if major == 1:
+        headerLength = struct.unpack("<H", data[8:10])[0]
+        start = 10
+    else:
+        headerLength = struct.unpack("<I", data[8:12])[0]
+        start = 12
+    header = ast.literal_eval(bytes(data[start:start + headerLength]).decode("latin1"))
+    return header, start + headerLength
+
+def loadMatrix(fileName, copyOnWrite=False):
+    """
+    @param fileName String A .npy matrix written by writeMatrix() or a legacy
+                           text matrix
+    @param copyOnWrite Boolean Whether a memory-mapped matrix may be modified;
+                               the changes are kept in memory, not written back
+                               to the file
+    @return The matrix, indexable as matrix[i][j]: a memory-mapped NumPy array
+            (or, without NumPy, a list of memoryview rows into the mapped file)
+            for .npy files, or a list of lists for text files
+    """
+    if not isNpyFile(fileName):
+        return readTextMatrix(fileName)
+
+    if numpy is not None:
+        return numpy.load(fileName, mmap_mode="c" if copyOnWrite else "r")
+
+    matrixFile = open(fileName, "rb")
+    data = mmap.mmap(matrixFile.fileno(), 0, access=mmap.ACCESS_COPY if copyOnWrite
+                                                    else mmap.ACCESS_READ)
+    matrixFile.close()
+    header, start = readNpyHeader(data)
+    if header["descr"] != NPY_DESCR or header["fortran_order"] \
+            or sys.byteorder != "little":
+        raise ValueError("Can't map " + fileName + " without NumPy")
+    numRows, numCols = header["shape"]
+    values = memoryview(data)[start:start + 4 * numRows * numCols].cast("i")
+    return [values[i * numCols:(i + 1) * numCols] for i in range(numRows)]
@@ -0,0 +1,119 @@
+'''
+A bounded, least-recently-used cache of overlap() results, keyed by a hash of the
+two fragments' contents. It can be saved to disk and loaded again, so that
+rerunning a stage on fragments it has already seen costs no new overlap() calls.
+
+Written for Python 3
+'''
+
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+
+# The default number of pairs to keep
+DEFAULT_MAX_SIZE = 1 << 20
+
+# Bump this if the on-disk format changes
+CACHE_FORMAT = 1
+
+def getPairKey(s1, s2):
+    '''
+    @return Bytes A 16-byte hash identifying the ordered pair of fragments
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(s1.encode("ascii"))
+    digest.update(b"\0")
+    digest.update(s2.encode("ascii"))
+    return digest.digest()
+
+class OverlapCache:
+    '''
+    Maps (s1, s2) to the (overlap length, offset) tuple overlap(s1, s2) returned.
+
+    The tag describes the settings the results were computed with (e.g. the
+    allowed error rate); a cache saved with a different tag is ignored on load.
+    '''
+
+    def __init__(self, maxSize=DEFAULT_MAX_SIZE, tag=None):
+        self.maxSize = maxSize
+        self.tag = tag
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, s1, s2):
+        '''
+        @return Tuple The cached (overlap length, offset), or None on a miss
+        '''
+        key = getPairKey(s1, s2)
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return result
+
+    def put(self, s1, s2, result):
+        key = getPairKey(s1, s2)
+        self.entries[key] = tuple(int(value) for value in result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def getOverlap(self, s1, s2, overlapFunction):
+        '''
+        @param overlapFunction Function Called as overlapFunction(s1, s2) on a miss
+        @return Tuple (overlap length, offset)
+        '''
+        result = self.get(s1, s2)
+        if result is None:
+            result = overlapFunction(s1, s2)
+            self.put(s1, s2, result)
+        return result
+
+    def getStats(self):
+        '''
+        @return Dictionary The number of "hits", "misses" and "evictions" so far,
+                and the current number of "entries"
+        '''
+        return { "hits": self.hits, "misses": self.misses,
+                 "evictions": self.evictions, "entries": len(self.entries) }
+
+    def save(self, filename):
+        '''
+        Writes the cache (least recently used entries first) to a file
+        '''
+        temporaryFile = filename + ".tmp"
+        with open(temporaryFile, "wb") as outfile:
+            pickle.dump((CACHE_FORMAT, self.tag, list(self.entries.items())),
+                        outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporaryFile, filename)
+
+def loadOverlapCache(filename, maxSize=DEFAULT_MAX_SIZE, tag=None):
+    '''
+    @return OverlapCache The cache saved in the file, or an empty cache if there
+            is no such file or it was saved with a different tag or format
+    '''
+    cache = OverlapCache(maxSize, tag)
+    if not os.path.exists(filename):
+        return cache
+
+    with open(filename, "rb") as infile:
+        try:
+            cacheFormat, savedTag, entries = pickle.load(infile)
+        except (pickle.UnpicklingError, EOFError, ValueError, TypeError):
+            return cache
+    if cacheFormat != CACHE_FORMAT or savedTag != tag:
+        return cache
+
+    # Only keep the most recently used entries if the file holds too many
+    for key, result in entries[-maxSize:] if maxSize > 0 else []:
+        cache.entries[key] = result
+    return cache
@@ -0,0 +1,371 @@
+'''
+A sparse alternative to the dense overlap and offset matrices, for inputs too big
+to compare every pair of fragments or to hold N x N matrices in memory.
+
+Only the pairs which pass the k-mer seed filter (see team_3_seedFilter.py) are
+scored, one fragment at a time, and only the overlaps of at least MIN_OVERLAP
+bases are kept as edges of a graph: for each fragment, its TOP_K longest outgoing
+and TOP_K longest incoming overlaps. The anti-sense check only needs the largest
+overlaps into and out of each fragment (and of its reverse compliment), so just
+the ANTISENSE_TOP_K largest of each are kept for it. The graph is then
+transitively reduced, as in a string graph: if a overlaps b, b overlaps c and a
+overlaps c with (about) the same offset as going through b, the edge from a to c
+tells us nothing new and is dropped.
+
+Memory grows with N * (TOP_K + ANTISENSE_TOP_K) rather than N * N, and the seeds
+are GRAPH_SEED_LENGTH long so that the number of pairs scored stays close to
+linear in N: two unrelated fragments share a k-mer by chance with a probability
+that falls off as 4^-k.
+
+A missing edge means the same thing as a zero in the dense matrices: no overlap,
+so the next fragment starts right after the end of the first (an offset of its
+length). The graph's offsetMatrix can therefore be used wherever the layout
+writers and team_3_tourSolver.py expect an offset matrix, and orderFragments()
+runs the tour solver on the graph's edges only.
+
+Written for Python 3
+'''
+
+import heapq
+
+import team_3_scoreAlignments as scoring
+import team_3_tourSolver
+from team_3_seedFilter import buildSeedIndex, getCandidateColumns
+
+# How many of the longest outgoing (and incoming) overlaps to keep per fragment
+TOP_K = 8
+
+# How many of the largest overlaps into and out of each fragment (as it is and
+# reverse-complimented) to keep for the anti-sense check. Once all of them belong
+# to fragments which were removed, the check treats the rest as no overlap.
+ANTISENSE_TOP_K = 4
+
+# The k-mer length of the seed filter. With 8-mers (65,536 of them) the number of
+# pairs which share one by chance grows as N^2; 12-mers (about 17 million) keep
+# it small next to the true overlaps for millions of bases of reads. Overlaps
+# without an exact 12-mer in common are mostly missed, so short reads may do
+# better with a shorter seed.
+GRAPH_SEED_LENGTH = 12
+
+# Overlaps shorter than this are left out of the graph
+MIN_OVERLAP = 8
+
+# How far (in bases) the offset through an intermediate fragment may be from the
+# direct offset for the direct edge to count as transitive
+TRANSITIVE_FUZZ = 2
+
+# The file the graph is written to, in place of overlap.npy and offsets.npy
+OVERLAP_GRAPH_FILE = "overlapGraph.tsv"
+
+class SparseOffsetRow:
+    ''' Row i of an OverlapGraph's offset matrix '''
+
+    def __init__(self, edges, length):
+        self.edges = edges
+        self.length = length
+
+    def __getitem__(self, j):
+        edge = self.edges.get(j)
+        return self.length if edge is None else edge[1]
+
+class SparseOffsetMatrix:
+    '''
+    An OverlapGraph viewed as an offset matrix: entry [i][j] is the offset of
+    the edge from i to j, or the length of fragment i if there's no such edge
+    '''
+
+    def __init__(self, graph):
+        self.rows = [SparseOffsetRow(edges, length)
+                     for edges, length in zip(graph.successors, graph.lengths)]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        return self.rows[i]
+
+class OverlapGraph:
+    '''
+    successors[i] maps each fragment j that fragment i overlaps to the tuple
+    (overlap length, offset) of overlap(fragment i, fragment j); predecessors[j]
+    maps i to the same tuple.
+    '''
+
+    def __init__(self, lengths):
+        self.lengths = list(lengths)
+        self.successors = [{} for length in self.lengths]
+        self.predecessors = [{} for length in self.lengths]
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def addEdge(self, i, j, theOverlap, theOffset):
+        self.successors[i][j] = (theOverlap, theOffset)
+        self.predecessors[j][i] = (theOverlap, theOffset)
+
+    def removeEdge(self, i, j):
+        del self.successors[i][j]
+        del self.predecessors[j][i]
+
+    def getNumEdges(self):
+        return sum(len(edges) for edges in self.successors)
+
+    def getEdges(self):
+        '''
+        @return Generator of tuples (i, j, overlap length, offset) for each edge
+        '''
+        for i, edges in enumerate(self.successors):
+            for j, (theOverlap, theOffset) in edges.items():
+                yield i, j, theOverlap, theOffset
+
+    def getOffsetMatrix(self):
+        return SparseOffsetMatrix(self)
+
+    def getNeighborLists(self):
+        '''
+        @return Tuple (best successors, best predecessors) of each fragment, in
+                the form team_3_tourSolver.improveTour() expects: its neighbors
+                in the graph, smallest offset first
+        '''
+        successors = [sorted(edges, key=lambda j: edges[j][1])
+                      for edges in self.successors]
+        predecessors = [sorted(edges, key=lambda i: edges[i][1])
+                        for edges in self.predecessors]
+        return successors, predecessors
+
+def pushBounded(heap, item, size):
+    ''' Pushes the item onto the heap, keeping only the size largest items '''
+    if len(heap) < size:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+class SparseScores:
+    '''
+    What getSparseScores() keeps of the scored pairs: the candidate edges of the
+    graph, and the largest overlaps the anti-sense check needs.
+
+    edges maps (i, j) to the (overlap length, offset) of overlap(fragment i,
+    fragment j), for the TOP_K longest overlaps of at least MIN_OVERLAP out of
+    each fragment and into each fragment. maxima holds four lists, one entry per
+    fragment: the largest overlaps out of it, into it, out of its reverse
+    compliment and into it from other fragments' reverse compliments. Each entry
+    is a list of (overlap length, other fragment) tuples, largest first.
+    '''
+
+    def __init__(self, edges, maxima):
+        self.edges = edges
+        self.maxima = maxima
+
+def getSparseScores(fragments, seedLength=GRAPH_SEED_LENGTH, engine=None,
+                    topK=TOP_K, minOverlap=MIN_OVERLAP,
+                    antisenseTopK=ANTISENSE_TOP_K):
+    '''
+    Scores the pairs of fragments which pass the seed filter, both as they are
+    and with the first fragment reverse-complimented, keeping only a bounded
+    number of results per fragment (a fragment's overlap with itself is
+    skipped).
+
+    @return SparseScores The edges and maxima kept
+    '''
+    if engine is None:
+        engine = scoring.OVERLAP_ENGINE
+    numSeqs = len(fragments)
+    index = buildSeedIndex(fragments, seedLength)
+    columns = scoring.prepareColumns(fragments, engine)
+
+    outgoing = [[] for i in range(numSeqs)]
+    incoming = [[] for i in range(numSeqs)]
+    # Heaps of (overlap length, -other fragment), so that ties go to the lower
+    # index, as in buildOverlapGraph()
+    maxima = [[[] for i in range(numSeqs)] for k in range(4)]
+    numPairs = 0
+    numCandidates = 0
+    for i, fragment in enumerate(fragments):
+        for k, s1 in enumerate((fragment, scoring.getReverseCompliment(fragment))):
+            candidates = [j for j in getCandidateColumns(s1, index, seedLength) if j != i]
+            scores, offsets = scoring.computeCandidateOverlaps(s1, columns, candidates,
+                                                               engine)
+            numPairs += numSeqs
+            numCandidates += len(candidates)
+            rowMaxima = maxima[2 * k]
+            columnMaxima = maxima[2 * k + 1]
+            for j, theOverlap, theOffset in zip(candidates, scores, offsets):
+                if theOverlap <= 0:
+                    continue
+                pushBounded(rowMaxima[i], (theOverlap, -j), antisenseTopK)
+                pushBounded(columnMaxima[j], (theOverlap, -i), antisenseTopK)
+                if k == 0 and theOverlap >= minOverlap:
+                    pushBounded(outgoing[i], (theOverlap, -j, theOffset), topK)
+                    pushBounded(incoming[j], (theOverlap, -i, theOffset), topK)
+    print("Seed filter skipped", numPairs - numCandidates, "of", numPairs, "pairs.")
+
+    edges = {}
+    for i, heap in enumerate(outgoing):
+        for theOverlap, negativeJ, theOffset in heap:
+            edges[(i, -negativeJ)] = (theOverlap, theOffset)
+    for j, heap in enumerate(incoming):
+        for theOverlap, negativeI, theOffset in heap:
+            edges[(-negativeI, j)] = (theOverlap, theOffset)
+    maxima = [ [[(theOverlap, -negativeJ) for theOverlap, negativeJ
+                 in sorted(heap, reverse=True)] for heap in lists]
+               for lists in maxima ]
+    return SparseScores(edges, maxima)
+
+def removeAntisenseFragmentsSparse(scores, maxIterations=None):
+    '''
+    Does the same pruning as team_3_scoreAlignments.removeAntisenseFragments(),
+    using only the maxima kept by getSparseScores(). A missing pair counts as an
+    overlap of 0, as it would in the dense matrices.
+
+    @param scores SparseScores The scored pairs
+    @return List of integers The indices of the fragments that survived
+    '''
+    rowMaxima, columnMaxima, revCompRowMaxima, revCompColumnMaxima = scores.maxima
+    numSeqs = len(rowMaxima)
+    alive = [True] * numSeqs
+
+    def getAliveMax(entries):
+        for theOverlap, k in entries:
+            if alive[k]:
+                return theOverlap
+        return 0
+
+    iteration = 0
+    while (maxIterations is None or iteration < maxIterations) and sum(alive) > 1:
+        toRemove = [ i for i in range(numSeqs) if alive[i]
+                     and getAliveMax(rowMaxima[i]) < getAliveMax(revCompRowMaxima[i])
+                     and getAliveMax(columnMaxima[i])
+                         < getAliveMax(revCompColumnMaxima[i]) ]
+        scoring.reportAntisenseIteration(iteration, len(toRemove))
+        iteration += 1
+        if len(toRemove) == 0:
+            break
+        for i in toRemove:
+            alive[i] = False
+
+    return [i for i in range(numSeqs) if alive[i]]
+
+def buildOverlapGraph(lengths, overlapRows, offsetRows, topK=TOP_K,
+                      minOverlap=MIN_OVERLAP):
+    '''
+    @param lengths List of integers The length of each fragment
+    @param overlapRows List of dictionaries Row i maps j to the length of
+                                            overlap(fragment i, fragment j)
+    @param offsetRows List of dictionaries The matching offsets
+    @return OverlapGraph The topK longest outgoing and incoming overlaps of each
+            fragment of at least minOverlap bases
+    '''
+    numSeqs = len(lengths)
+    incoming = [[] for i in range(numSeqs)]
+    kept = set()
+    for i, row in enumerate(overlapRows):
+        candidates = [(theOverlap, -j) for j, theOverlap in row.items()
+                      if j != i and theOverlap >= minOverlap]
+        for theOverlap, negativeJ in heapq.nlargest(topK, candidates):
+            kept.add((i, -negativeJ))
+        for theOverlap, negativeJ in candidates:
+            # Keep only the topK longest overlaps into each fragment
+            heap = incoming[-negativeJ]
+            if len(heap) < topK:
+                heapq.heappush(heap, (theOverlap, -i))
+            elif (theOverlap, -i) > heap[0]:
+                heapq.heapreplace(heap, (theOverlap, -i))
+    for j, heap in enumerate(incoming):
+        for theOverlap, negativeI in heap:
+            kept.add((-negativeI, j))
+
+    graph = OverlapGraph(lengths)
+    for i, j in sorted(kept):
+        graph.addEdge(i, j, overlapRows[i][j], offsetRows[i][j])
+    return graph
+
+def reduceTransitiveEdges(graph, fuzz=TRANSITIVE_FUZZ):
+    '''
+    Removes every edge a -> c for which there are edges a -> b and b -> c whose
+    offsets add up to within fuzz of the offset of a -> c.
+
+    @return Integer The number of edges removed
+    '''
+    transitive = set()
+    for a, successorsOfA in enumerate(graph.successors):
+        for b, (overlapAB, offsetAB) in successorsOfA.items():
+            for c, (overlapBC, offsetBC) in graph.successors[b].items():
+                if c == a or c not in successorsOfA:
+                    continue
+                if abs(offsetAB + offsetBC - successorsOfA[c][1]) <= fuzz:
+                    transitive.add((a, c))
+    for a, c in transitive:
+        graph.removeEdge(a, c)
+    return len(transitive)
+
+def getOverlapGraph(fragments, topK=TOP_K, minOverlap=MIN_OVERLAP,
+                    seedLength=GRAPH_SEED_LENGTH, engine=None, pruneAntisense=True):
+    '''
+    Builds the graph for the fragments left after removing duplicates, in place
+    of team_3_scoreAlignments.removeAntisenseFragments().
+
+    @return Tuple (the surviving fragments, their transitively reduced overlap
+                   graph)
+    '''
+    scores = getSparseScores(fragments, seedLength, engine, topK, minOverlap)
+    survivors = list(range(len(fragments)))
+    if pruneAntisense:
+        survivors = removeAntisenseFragmentsSparse(scores)
+
+    newIndex = dict((old, new) for new, old in enumerate(survivors))
+    survivingOverlaps = [{} for i in survivors]
+    survivingOffsets = [{} for i in survivors]
+    for (i, j), (theOverlap, theOffset) in scores.edges.items():
+        if i in newIndex and j in newIndex:
+            survivingOverlaps[newIndex[i]][newIndex[j]] = theOverlap
+            survivingOffsets[newIndex[i]][newIndex[j]] = theOffset
+    survivingFragments = [fragments[i] for i in survivors]
+
+    graph = buildOverlapGraph([len(f) for f in survivingFragments], survivingOverlaps,
+                              survivingOffsets, topK, minOverlap)
+    numRemoved = reduceTransitiveEdges(graph)
+    print("The overlap graph has", graph.getNumEdges(), "edges after removing",
+          numRemoved, "transitive ones.")
+    return survivingFragments, graph
+
+def orderFragments(graph, timeBudget=team_3_tourSolver.TIME_BUDGET):
+    '''
+    Runs the tour solver on the graph: a greedy tour over its edges, improved by
+    local search moves between neighbors in the graph.
+
+    @return Tuple (score, tour)
+    '''
+    edges = [(theOverlap, i, j) for i, j, theOverlap, theOffset in graph.getEdges()]
+    tour = team_3_tourSolver.getGreedyTourFromEdges(len(graph), edges)
+    offsetMatrix = graph.getOffsetMatrix()
+    tour = team_3_tourSolver.improveTour(tour, offsetMatrix, graph.lengths, timeBudget,
+                                         neighborLists=graph.getNeighborLists())
+    return team_3_tourSolver.getTourScore(offsetMatrix, graph.lengths, tour), tour
+
+def writeOverlapGraph(fileName, graph):
+    '''
+    Writes the number of fragments on the first line, then one tab-separated
+    line per edge: the two fragments, the overlap length and the offset
+    '''
+    graphFile = open(fileName, "w")
+    graphFile.write("# fragments\t%d\n" % len(graph))
+    graphFile.write("".join("%d\t%d\t%d\t%d\n" % edge for edge in graph.getEdges()))
+    graphFile.close()
+
+def readOverlapGraph(fileName, fragments):
+    '''
+    @param fragments List of strings The fragments the graph was built from
+    @return OverlapGraph The graph written by writeOverlapGraph()
+    '''
+    graphFile = open(fileName, "r")
+    numSeqs = int(graphFile.readline().split()[-1])
+    if numSeqs != len(fragments):
+        raise ValueError(fileName + " doesn't match the fragments")
+    graph = OverlapGraph([len(f) for f in fragments])
+    for line in graphFile:
+        values = line.split()
+        if len(values) == 4:
+            graph.addEdge(*[int(value) for value in values])
+    graphFile.close()
+    return graph
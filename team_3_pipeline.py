@@ -0,0 +1,269 @@
+'''
+Runs the whole assembly in one process: filtering the fragments, building the
+overlap and offset matrices, ordering the fragments and laying them out. Each
+stage hands its results to the next in memory, instead of through the files the
+three separate programs communicate with.
+
+With --checkpoint, each stage also writes its results to the output directory
+(in the same formats team_3_scoreAlignments.py and team_3_tsp.py use), so that a
+later run can pick up at any stage with --resume:
+  - filter:    fragments.store, flagging the fragments that are too short or
+               contained in another one
+  - matrices:  fragments.store (now also flagging the anti-sense fragments),
+               overlap.npy and offsets.npy (or, with --graph, overlapGraph.tsv)
+  - order:     alignmentOrder.txt
+  - layout:    alignments.csv and alignments.tsv (always written)
+  - consensus: consensus.fasta and consensus.tsv (always written)
+
+    $ python3 team_3_pipeline.py fragments.fasta --checkpoint
+    $ python3 team_3_pipeline.py --resume order
+
+Written for Python 3
+'''
+
+import argparse
+import os
+import time
+
+import team_3_scoreAlignments as scoring
+import team_3_tourSolver
+import team_3_instrumentation as instrumentation
+from readfasta import iterfasta
+from team_3_fragmentStore import FRAGMENT_STORE_FILE, ANTISENSE, FragmentStore, \
+                                 writeFragmentStore, getFilterFlags
+from team_3_matrixIO import findMatrixFile, loadMatrix, writeMatrix
+from team_3_overlapCache import loadOverlapCache
+from team_3_prettyPrintTSPAlignments import readAlignmentOrder, getAlignmentPairs, \
+                                            printAlignments, writeAlignmentCSV, \
+                                            writeSparseLayout
+from team_3_tsp import writeResults
+from team_3_overlapGraph import OVERLAP_GRAPH_FILE, getOverlapGraph, orderFragments, \
+                                writeOverlapGraph, readOverlapGraph
+from team_3_consensus import buildConsensus, writeConsensusFasta, writeCoverageTable
+
+STAGES = ["filter", "matrices", "order", "layout", "consensus"]
+
+class PipelineState:
+    '''
+    What the stages have computed so far. Each stage reads the fields set by the
+    ones before it.
+    '''
+
+    def __init__(self, useGraph=False):
+        # Whether the matrices stage builds a sparse overlap graph (see
+        # team_3_overlapGraph.py) instead of dense matrices
+        self.useGraph = useGraph
+        self.graph = None
+        self.allFragments = None           # every fragment in the input
+        self.deduplicatedFragments = None  # those left after the filter stage
+        self.fragments = None              # those left after the matrices stage
+        self.overlapMatrix = None
+        self.offsetMatrix = None
+        self.score = None
+        self.order = None
+        self.contigs = None
+        self.timings = []                  # (stage, seconds) for each stage run
+
+def runFilterStage(state, fastaFile):
+    state.allFragments = [sequence for label, header, sequence in iterfasta(fastaFile)]
+    longEnough = [f for f in state.allFragments if len(f) > scoring.MIN_LENGTH]
+    state.deduplicatedFragments = scoring.removeDuplicates(longEnough)
+    print("After removing short and duplicated fragments, we have",
+          len(state.deduplicatedFragments), "fragments.")
+
+def runMatricesStage(state, outputDir):
+    if scoring.OVERLAP_CACHE_FILE is not None:
+        cacheFile = os.path.join(outputDir, scoring.OVERLAP_CACHE_FILE)
+        scoring.overlapCache = loadOverlapCache(cacheFile, scoring.OVERLAP_CACHE_SIZE,
+                                                scoring.getOverlapCacheTag())
+
+    if state.useGraph:
+        state.fragments, state.graph = getOverlapGraph(state.deduplicatedFragments)
+        state.offsetMatrix = state.graph.getOffsetMatrix()
+    else:
+        state.fragments, state.overlapMatrix, state.offsetMatrix = \
+            scoring.removeAntisenseFragments(state.deduplicatedFragments)
+    print("After removing fragments that fit better on the anti-sense strand, we "
+          + "have", len(state.fragments), "fragments.")
+
+    if scoring.overlapCache is not None:
+        scoring.overlapCache.save(cacheFile)
+
+def runOrderStage(state, timeBudget):
+    if state.useGraph:
+        state.score, state.order = orderFragments(state.graph, timeBudget)
+    else:
+        lengths = [len(f) for f in state.fragments]
+        state.score, state.order = team_3_tourSolver.solveTour(
+            state.overlapMatrix, state.offsetMatrix, lengths, timeBudget)
+    print("Best score:", state.score)
+
+def runLayoutStage(state, outputDir, quiet=False):
+    alignments = getAlignmentPairs(state.order)
+    if not quiet:
+        printAlignments(state.fragments, alignments, state.offsetMatrix)
+    writeAlignmentCSV(os.path.join(outputDir, "alignments.csv"), state.fragments,
+                      alignments, state.offsetMatrix)
+    writeSparseLayout(os.path.join(outputDir, "alignments.tsv"), state.fragments,
+                      alignments, state.offsetMatrix)
+
+def runConsensusStage(state, outputDir):
+    state.contigs = buildConsensus(state.fragments, state.order, state.offsetMatrix)
+    writeConsensusFasta(os.path.join(outputDir, "consensus.fasta"), state.contigs)
+    writeCoverageTable(os.path.join(outputDir, "consensus.tsv"), state.contigs)
+    print("Assembled", len(state.contigs), "contigs.")
+
+def writeCheckpoint(state, stage, outputDir):
+    ''' Writes the results of the stage to the output directory '''
+    storeFile = os.path.join(outputDir, FRAGMENT_STORE_FILE)
+    if stage == "filter":
+        writeFragmentStore(storeFile, state.allFragments,
+                           getFilterFlags(state.allFragments, scoring.MIN_LENGTH,
+                                          state.deduplicatedFragments),
+                           scoring.MIN_LENGTH)
+    elif stage == "matrices":
+        writeFragmentStore(storeFile, state.allFragments,
+                           getFilterFlags(state.allFragments, scoring.MIN_LENGTH,
+                                          state.deduplicatedFragments, state.fragments),
+                           scoring.MIN_LENGTH)
+        if state.useGraph:
+            writeOverlapGraph(os.path.join(outputDir, OVERLAP_GRAPH_FILE), state.graph)
+        else:
+            writeMatrix(os.path.join(outputDir, "overlap.npy"), state.overlapMatrix)
+            writeMatrix(os.path.join(outputDir, "offsets.npy"), state.offsetMatrix)
+    elif stage == "order":
+        writeResults(os.path.join(outputDir, "alignmentOrder"), state.order,
+                     state.score, None, None, None)
+
+def loadCheckpoint(state, stage, outputDir):
+    '''
+    Loads the results of every stage before the given one from the output
+    directory
+    '''
+    stagesToLoad = STAGES[:STAGES.index(stage)]
+    if len(stagesToLoad) == 0:
+        return
+
+    store = FragmentStore(os.path.join(outputDir, FRAGMENT_STORE_FILE))
+    state.allFragments = list(store)
+    # Whether or not the matrices stage has run since, the fragments which were
+    # only flagged as anti-sense passed the filter stage
+    state.deduplicatedFragments = [store[i] for i in range(len(store))
+                                   if store.flags[i] & ~ANTISENSE == 0]
+    if "matrices" in stagesToLoad:
+        state.fragments = store.getSurvivors()
+        if state.useGraph:
+            state.graph = readOverlapGraph(os.path.join(outputDir, OVERLAP_GRAPH_FILE),
+                                           state.fragments)
+            state.offsetMatrix = state.graph.getOffsetMatrix()
+        else:
+            state.overlapMatrix = loadMatrix(findMatrixFile(os.path.join(outputDir,
+                                                                         "overlap")))
+            state.offsetMatrix = loadMatrix(findMatrixFile(os.path.join(outputDir,
+                                                                        "offsets")))
+    store.close()
+
+    if "order" in stagesToLoad:
+        state.order = readAlignmentOrder(os.path.join(outputDir, "alignmentOrder.txt"))
+        state.score = team_3_tourSolver.getTourScore(
+            state.offsetMatrix, [len(f) for f in state.fragments], state.order)
+
+def printTimings(timings):
+    print("\nStage timings:")
+    for stage, seconds in timings:
+        print("  %-10s %8.3f s" % (stage, seconds))
+    print("  %-10s %8.3f s" % ("total", sum(seconds for stage, seconds in timings)))
+
+def runPipeline(fastaFile="fragments.fasta", outputDir=".", checkpoint=False,
+                resumeFrom=None, timeBudget=None, quiet=False, useGraph=False):
+    '''
+    @param fastaFile String The reads to assemble
+    @param outputDir String Where to write the checkpoints and outputs
+    @param checkpoint Boolean Whether to write each stage's results to disk
+    @param resumeFrom String The stage to start at (one of STAGES), loading the
+                             results of the earlier stages from their checkpoints
+    @param timeBudget Float Seconds the local search may spend ordering the
+                            fragments (default: team_3_tourSolver.TIME_BUDGET)
+    @param quiet Boolean Whether to skip printing the layout to the screen
+    @param useGraph Boolean Whether to use a sparse overlap graph instead of
+                            dense matrices (for large inputs)
+    @return PipelineState The results of every stage, and how long each took
+    '''
+    if resumeFrom is None:
+        resumeFrom = STAGES[0]
+    if resumeFrom not in STAGES:
+        raise ValueError("Unknown stage: " + str(resumeFrom))
+    if timeBudget is None:
+        timeBudget = team_3_tourSolver.TIME_BUDGET
+
+    state = PipelineState(useGraph)
+    loadCheckpoint(state, resumeFrom, outputDir)
+
+    for stage in STAGES[STAGES.index(resumeFrom):]:
+        startTime = time.perf_counter()
+        with instrumentation.stage(stage):
+            if stage == "filter":
+                runFilterStage(state, fastaFile)
+            elif stage == "matrices":
+                runMatricesStage(state, outputDir)
+            elif stage == "order":
+                runOrderStage(state, timeBudget)
+            elif stage == "layout":
+                runLayoutStage(state, outputDir, quiet)
+            else:
+                runConsensusStage(state, outputDir)
+            if checkpoint:
+                writeCheckpoint(state, stage, outputDir)
+        state.timings.append((stage, time.perf_counter() - startTime))
+
+    if scoring.MATRIX_TILE_DIRECTORY:
+        # Every output has been written, so the finished tiles won't be needed
+        import team_3_tiledMatrix
+        team_3_tiledMatrix.removeFinishedJobs(scoring.MATRIX_TILE_DIRECTORY)
+
+    printTimings(state.timings)
+    return state
+
+def main():
+    parser = argparse.ArgumentParser(description="Assemble the fragments in a "
+                                     + "FASTA file in a single process.")
+    parser.add_argument("fasta", nargs="?", default="fragments.fasta",
+                        help="the reads to assemble (default: fragments.fasta)")
+    parser.add_argument("--output-dir", default=".",
+                        help="where to write the checkpoints and outputs")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="write each stage's results to the output directory")
+    parser.add_argument("--resume", choices=STAGES, default=None,
+                        help="start at this stage, loading the earlier stages' "
+                        + "checkpoints")
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="seconds to spend ordering the fragments")
+    parser.add_argument("--quiet", action="store_true",
+                        help="don't print the layout to the screen")
+    parser.add_argument("--graph", action="store_true",
+                        help="use a sparse overlap graph instead of dense "
+                        + "matrices (see team_3_overlapGraph.py)")
+    parser.add_argument("--tiles", default=None,
+                        help="build the matrices in tiles checkpointed under this "
+                        + "directory, so that an interrupted run can skip the "
+                        + "finished tiles (see team_3_tiledMatrix.py)")
+    parser.add_argument("--instrument", action="store_true",
+                        help="write counters and per-stage timings to "
+                        + "instrumentation.json (see team_3_instrumentation.py)")
+    parser.add_argument("--profile", default=None,
+                        help="with --instrument, also dump cProfile statistics "
+                        + "to this file")
+    args = parser.parse_args()
+
+    if args.tiles is not None:
+        scoring.MATRIX_TILE_DIRECTORY = args.tiles
+    if args.instrument:
+        instrumentation.enable(os.path.join(args.output_dir,
+                                            instrumentation.REPORT_FILE),
+                               args.profile)
+
+    runPipeline(args.fasta, args.output_dir, args.checkpoint, args.resume,
+                args.time_budget, args.quiet, args.graph)
+
+if __name__ == "__main__":
+    main()
@@ -7,32 +7,91 @@ Relies on you first having run team_3_tsp.py in the current working directory.
 Tyler Young and Bob Barnhart
 Written for Python 3
 """
-from team_3_scoreAlignments import overlap, getFragments
+import os
+import sys
+from team_3_fragmentStore import FRAGMENT_STORE_FILE, readFragments
+from team_3_matrixIO import findMatrixFile, loadMatrix
 
 def getSimplifiedFragments(filename):
-    f = open(filename, 'rU')
-    resultList = []
-
-    # initialize the sequence accumulator
-    for line in f:
-        line = line.rstrip()
-
-        # ignore blank lines
-        if line != '':
-            resultList.append(line)
-    return resultList
-
-
+    '''
+    @param filename String A fragment store or a file with one fragment per line
+    @return List of strings The (filtered) fragments
+    '''
+    return readFragments(filename)
+
+
+
+def getOffsetMatrix(filename):
+    '''
+    @param filename String The offset matrix written by team_3_scoreAlignments.py
+                           (.npy or legacy text)
+    @return Matrix Entry [i][j] is where fragment j starts relative to the start
+                   of fragment i when j follows i
+    '''
+    return loadMatrix(filename)
+
+def readAlignmentOrder(filename):
+    '''
+    @param filename String The alignmentOrder.txt file written by team_3_tsp.py
+    @return List of integers The order of the fragments
+    '''
+    alignmentFile = open(filename, "r")
+    # Strip the comments
+    fileContents = ( alignmentFile.read().split("#") )[0] #ignore everything after the hash
+    alignmentFile.close()
+    return [int(index) for index in fileContents.split()] # split the sequence on spaces
 
-def printAlignments( listOfFragments, alignmentList ):
+def getAlignmentPairs(alignmentSequence):
+    ''' @return List of tuples Each pair of neighboring fragments in the order '''
+    alignments = []
+    for i in range( len(alignmentSequence)-1 ):
+        alignments.append( ( int(alignmentSequence[i]), int(alignmentSequence[i+1])) )
+    return alignments
+
+# How many characters of layout to collect before writing them out in one go
+WRITE_BUFFER_SIZE = 1 << 20
+
+def iterLayout( fragments, alignments, offsetMatrix ):
+    '''
+    @param alignments List of tuples Each pair of neighboring fragments, from
+                                     getAlignmentPairs()
+    @param offsetMatrix Matrix The offsets computed by team_3_scoreAlignments.py
+    @return Generator of tuples (row, fragment index, start offset) for each
+            fragment of the layout
+    '''
+    offset = 0
+    for row, pair in enumerate(alignments):
+        if pair[0] == pair[1] == 0:
+            break
+        yield row, pair[0], offset
+        offset += int(offsetMatrix[pair[0]][pair[1]])
+
+def writeBuffered( outfile, lines ):
+    ''' Writes the lines to the file in chunks of about WRITE_BUFFER_SIZE characters '''
+    chunk = []
+    chunkSize = 0
+    for line in lines:
+        chunk.append(line)
+        chunkSize += len(line)
+        if chunkSize >= WRITE_BUFFER_SIZE:
+            outfile.write("".join(chunk))
+            chunk = []
+            chunkSize = 0
+    outfile.write("".join(chunk))
+
+def getLayoutLength( fragments, alignments, offsetMatrix ):
+    ''' @return Integer Where the last fragment of the layout starts '''
     offset = 0
-    for pair in alignmentList:
+    for pair in alignments:
         if pair[0] == pair[1] == 0:
             break
-        print( (" "*offset), listOfFragments[pair[0]], sep="" )
-        theOverlap, addToOffset = overlap(listOfFragments[pair[0]], listOfFragments[pair[1]])
-        #print("Overlap between",listOfFragments[pair[0]], "and", listOfFragments[pair[1]], " was", theOverlap)
-        offset += addToOffset
+        offset += int(offsetMatrix[pair[0]][pair[1]])
+    return offset
+
+def printAlignments( listOfFragments, alignmentList, offsetMatrix ):
+    writeBuffered(sys.stdout, ( " "*offset + listOfFragments[i] + "\n"
+                                for row, i, offset
+                                in iterLayout(listOfFragments, alignmentList, offsetMatrix) ))
 
     # Count the base pairs:
     count = 0
@@ -40,40 +99,48 @@ def printAlignments( listOfFragments, alignmentList ):
         count += len(fragment)
     print("\n\nNumber of base pairs is",count)
     print("Expected length of the final sequence is",count,"/ (4*5) = ",count/(4*5))
-    print("Actual length of the sequence is a bit more than",offset)
+    print("Actual length of the sequence is a bit more than",
+          getLayoutLength(listOfFragments, alignmentList, offsetMatrix))
 
-def writeAlignmentCSV( fileToWriteTo, fragments, alignments ):
-    offset = 0
+def writeAlignmentCSV( fileToWriteTo, fragments, alignments, offsetMatrix ):
     csvFile = open(fileToWriteTo, "w")
-    for pair in alignments:
-        if pair[0] == pair[1] == 0:
-            break
-        csvFile.write( (" ,"*offset) )
-        for letter in fragments[pair[0]]:
-            csvFile.write( letter + "," )
-        csvFile.write("\n")
-        theOverlap, addToOffset = overlap(fragments[pair[0]], fragments[pair[1]])
-        #print("Overlap between",fragments[pair[0]], "and", fragments[pair[1]], " was", theOverlap)
-        offset += addToOffset
+    writeBuffered(csvFile, ( " ,"*offset + ",".join(fragments[i]) + ",\n"
+                             for row, i, offset
+                             in iterLayout(fragments, alignments, offsetMatrix) ))
+    csvFile.close()
+
+def writeSparseLayout( fileToWriteTo, fragments, alignments, offsetMatrix ):
+    '''
+    Writes the layout without any padding: one tab-separated line per fragment
+    with its row, start offset and sequence
+    '''
+    layoutFile = open(fileToWriteTo, "w")
+    layoutFile.write("row\tstart\tsequence\n")
+    writeBuffered(layoutFile, ( "%d\t%d\t%s\n" % (row, offset, fragments[i])
+                                for row, i, offset
+                                in iterLayout(fragments, alignments, offsetMatrix) ))
+    layoutFile.close()
 
 def main():
-    fragments = getSimplifiedFragments('fragments.txt')
-
-    alignmentFile = open("alignmentOrder.txt", "r")
-    # Strip the comments
-    fileContents = ( alignmentFile.read().split("#") )[0] #ignore everything after the hash
+    if os.path.exists(FRAGMENT_STORE_FILE):
+        fragments = getSimplifiedFragments(FRAGMENT_STORE_FILE)
+    else:
+        fragments = getSimplifiedFragments('fragments.txt')
+    offsetMatrix = getOffsetMatrix(findMatrixFile('offsets'))
 
-    alignmentSequence = fileContents.split() # split the sequence on spaces
+    alignmentSequence = readAlignmentOrder("alignmentOrder.txt")
     print("Alignment seq is", alignmentSequence)
-    alignments = []
-    for i in range( len(alignmentSequence)-1 ):
-        alignments.append( ( int(alignmentSequence[i]), int(alignmentSequence[i+1])) )
+    alignments = getAlignmentPairs(alignmentSequence)
 
 
     # Print the alignments normally
-    printAlignments( fragments, alignments )
+    printAlignments( fragments, alignments, offsetMatrix )
 
     # Write the alignments to a CSV file
-    writeAlignmentCSV( "alignments.csv", fragments, alignments )
+    writeAlignmentCSV( "alignments.csv", fragments, alignments, offsetMatrix )
+
+    # And in the compact format, without the padding
+    writeSparseLayout( "alignments.tsv", fragments, alignments, offsetMatrix )
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -15,9 +15,126 @@ MIN_LENGTH = 3
 # we reject this as a possible alignment
 ALLOWED_ERROR_RATE = 0.8
 
+# Which implementation of overlap() to use. "python" is the original character-by-
+# character loop; "numpy" scores each fragment against all the others in a few
+# array operations per step (several times faster when building the matrices, but
+# slower for a single pair) and requires NumPy. Both return exactly the same
+# results. "bitparallel" is a different scorer which
+# also allows insertions and deletions (see team_3_bitParallelOverlap.py), using
+# INDEL_ERROR_RATE instead of ALLOWED_ERROR_RATE.
+OVERLAP_ENGINE = "python"
+
+# For the "bitparallel" engine, the number of edits (substitutions, insertions or
+# deletions) allowed per base of an overlap
+INDEL_ERROR_RATE = 0.1
+
+# The number of processes to use when building the overlap matrices. With 1, the
+# matrices are built in this process; otherwise the rows are split into blocks
+# which are handed out to a pool of this many worker processes.
+NUM_WORKERS = 1
+
+# In parallel mode, the number of blocks to split the matrix rows into per worker
+BLOCKS_PER_WORKER = 4
+
+# Whether to compute the overlap and reverse-compliment matrices only once while
+# removing fragments that belong on the anti-sense strand, rather than once per
+# pruning iteration
+INCREMENTAL_PRUNING = True
+
+# The most pruning iterations to run; None means to keep going until an iteration
+# removes nothing
+ANTISENSE_MAX_ITERATIONS = None
+
+# How removeDuplicates() finds fragments contained in other fragments. "index"
+# uses an Aho-Corasick automaton over all the fragments (see team_3_containment.py);
+# "scan" is the original substring test between every pair of fragments.
+CONTAINMENT_ENGINE = "index"
+
+# If set, the matrix builders only run overlap() on pairs of fragments which share
+# a k-mer of this length (see team_3_seedFilter.py). Every other pair is scored as
+# having no overlap at all.
+SEED_FILTER_LENGTH = None
+
+# If set (with the seed filter on), only the k-mers in this many characters at the
+# end of the first fragment and the start of the second are compared, rather than
+# the k-mers of both whole fragments. That prunes far more pairs, but an overlap
+# much longer than the window can be missed, so it should be at least the longest
+# overlap you expect.
+SEED_FILTER_WINDOW = None
+
+# Whether main() should also write the matrices in the old text format
+# (overlap.txt and offsets.txt) next to the binary .npy files
+WRITE_TEXT_MATRICES = False
+
+# If set, the file main() keeps a cache of overlap() results in between runs (see
+# team_3_overlapCache.py), so that rerunning it on fragments it has already seen
+# doesn't recompute their overlaps. A run which finds nothing in it pays for
+# hashing and storing every pair (40% or so on top of the "numpy" engine), so it's
+# off by default.
+OVERLAP_CACHE_FILE = None
+
+# The most pairs of fragments the overlap cache holds before it evicts the least
+# recently used ones. A matrix with more pairs than this skips the cache, since
+# evicting in row order would leave nothing for a rerun to find.
+OVERLAP_CACHE_SIZE = 1 << 22
+
+# If set, overlap() only reports overlaps of at least this many bases, and scores
+# every shorter one as no overlap at all. The "python" engine then skips the
+# shifts too short to qualify, and stops as soon as no longer shift can beat the
+# best overlap found so far. For every pair whose overlap is at least this long,
+# the result is exactly the same as with None.
+MIN_OVERLAP_LENGTH = None
+
+# If set, the matrix builders compute the matrices in tiles which are checkpointed
+# under this directory as they finish (see team_3_tiledMatrix.py), so that a run
+# which is interrupted can skip the tiles it already computed when restarted. The
+# overlap cache isn't used then. Finished jobs are deleted once main() has written
+# the matrices.
+MATRIX_TILE_DIRECTORY = None
+
 import math
+import concurrent.futures
+from team_3_containment import getContainedFragmentIndices
+from team_3_seedFilter import SEED_LENGTH, getCandidatePairs
+from readfasta import iterfasta
+from team_3_fragmentStore import FRAGMENT_STORE_FILE, writeFragmentStore, getFilterFlags
+from team_3_matrixIO import writeMatrix, writeTextMatrix
+from team_3_overlapCache import loadOverlapCache
+from team_3_bitParallelOverlap import overlapBitParallel
+import team_3_instrumentation as instrumentation
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-def overlap( s1, s2 ):
+def overlap( s1, s2, engine=None ):
+    '''
+    Calculates the overlap between 2 strings using the engine named by engine
+    (or OVERLAP_ENGINE if none is given). See overlapPython() for the details.
+
+    @return Tuple (length of the overlap, index in s1 where the overlap starts)
+    '''
+    if engine is None:
+        engine = OVERLAP_ENGINE
+    if instrumentation.ENABLED:
+        instrumentation.count("overlap.calls")
+
+    if engine == "python":
+        if MIN_OVERLAP_LENGTH is None:
+            return overlapPython(s1, s2)
+        return overlapPythonWithCutoff(s1, s2, MIN_OVERLAP_LENGTH)
+    elif engine == "numpy":
+        return overlapNumpy(s1, s2)
+    elif engine == "bitparallel":
+        theOverlap, theOffset = overlapBitParallel(s1, s2, INDEL_ERROR_RATE)
+        if MIN_OVERLAP_LENGTH is not None and theOverlap < MIN_OVERLAP_LENGTH:
+            return 0, len(s1)
+        return theOverlap, theOffset
+    else:
+        raise ValueError("Unknown overlap engine: " + str(engine))
+
+def overlapPython( s1, s2 ):
     '''
     Calculates the overlap between 2 strings. The overlap between strings 1 and 2
     is the length of the longest prefix of string 2 that matches a suffix of
@@ -33,6 +150,9 @@ def overlap( s1, s2 ):
     maxSoFar = 0
     s2pos = 0
     alignmentStart = len(s1)
+    # How many times the inner loop runs, for instrumentation. It runs once per
+    # base compared, plus once more for an alignment that runs off the end of s2.
+    iterations = 0
     for s1pos in range(len(s1)-1, -1, -1):
         errorsSoFar = 0
 
@@ -45,6 +165,7 @@ def overlap( s1, s2 ):
             allowedErrorsHere = math.ceil( math.sqrt(i)*ALLOWED_ERROR_RATE )
 
             if i >= len(s2): # if s2 matches completely with an internal section of s1
+                iterations += 1
                 break
 
             if s2[i] == s1[s1pos + i]:
@@ -58,67 +179,276 @@ def overlap( s1, s2 ):
                     break
 
         s2pos += 1
+        iterations += maxAtThisSize
         if(maxAtThisSize > maxSoFar) and (errorsSoFar < allowedErrorsHere):
             maxSoFar = maxAtThisSize
             alignmentStart = potentialAlignmentStart
 
+    if instrumentation.ENABLED:
+        instrumentation.count("overlap.innerIterations", iterations)
     #print("Found max overlap of", string1, "and", string2, "to be", maxSoFar)
     return int(maxSoFar), alignmentStart
 
+def overlapPythonWithCutoff( s1, s2, minOverlap ):
+    '''
+    Calculates the same thing as overlapPython(), but only for overlaps of at
+    least minOverlap bases: a shorter overlap is reported as (0, len(s1)).
 
-def getReverseCompliment(string):
+    Every shift of s2 along s1 can score at most the number of bases it compares,
+    min(suffix length, len(s2)), and a later shift only replaces the best one if
+    it scores strictly more. So the suffixes shorter than minOverlap can be
+    skipped, and once an alignment covers all of s2, no longer suffix can beat it.
+    The shifts skipped each way are counted for instrumentation.
     '''
-    @param string Iterable The DNA sequence for which we should calculate the
-                           reverse compliment
-    @return Array The reverse compliment of the input string
-    '''
-    revComp = []
-    for letter in string:
-        if letter == 'A':
-            revComp.append('T')
-        elif letter == 'T':
-            revComp.append('A')
-        elif letter == 'C':
-            revComp.append('G')
-        elif letter == 'G':
-            revComp.append('C')
-        else:
-            print("ERROR! Non-DNA letter",letter,"found in your FASTA data.")
-            exit()
-    revComp.reverse()
-    revComp = "".join(revComp)
-    return revComp
+    len1 = len(s1)
+    len2 = len(s2)
+    if len2 < minOverlap:
+        if instrumentation.ENABLED:
+            instrumentation.count("overlap.shortPairs")
+            instrumentation.count("overlap.skippedShifts.belowMinimum", len1)
+        return 0, len1
 
-def getFragments(file):
-    f = open(file, 'rU')
-    resultList = []
+    maxSoFar = 0
+    alignmentStart = len1
+    firstShift = max(minOverlap, 1) - 1
+    # As in overlapPython()
+    iterations = 0
+    skippedAfterCutoff = 0
+    for s2pos in range(firstShift, len1):
+        if maxSoFar >= len2:
+            skippedAfterCutoff = len1 - s2pos
+            break
+        s1pos = len1 - 1 - s2pos
+        errorsSoFar = 0
 
-    # initialize the sequence accumulator
-    sequence = ''
+        maxAtThisSize = 0
+        for i in range(0, s2pos + 1):
+            allowedErrorsHere = math.ceil( math.sqrt(i)*ALLOWED_ERROR_RATE )
 
-    # process all the rest of the lines in the file
-    for line in f:
-        line = line.rstrip()
+            if i >= len2: # if s2 matches completely with an internal section of s1
+                iterations += 1
+                break
 
-        # ignore blank lines
-        if line == '':
-            continue
+            maxAtThisSize += 1
+            if s2[i] != s1[s1pos + i]:
+                errorsSoFar += 1
+                if errorsSoFar >= allowedErrorsHere:
+                    # Stop considering this as a possible alignment
+                    break
 
-        # if it's a header line, finish the previous sequence
-        # and start a new one
-        if line[0] == '>':
-            if sequence != "" and len(sequence) > MIN_LENGTH:
-                resultList.append(sequence)
-            sequence = ''
+        iterations += maxAtThisSize
+        if(maxAtThisSize > maxSoFar) and (errorsSoFar < allowedErrorsHere):
+            maxSoFar = maxAtThisSize
+            alignmentStart = s1pos
 
-        # if we're here, we must be in letters of the sequence
-        else:
-            sequence += line
+    if instrumentation.ENABLED:
+        instrumentation.count("overlap.innerIterations", iterations)
+        instrumentation.count("overlap.skippedShifts.belowMinimum", min(firstShift, len1))
+        instrumentation.count("overlap.skippedShifts.cutoff", skippedAfterCutoff)
+    return int(maxSoFar), alignmentStart
+
+# Cache for getAllowedErrorsTable(), rebuilt whenever ALLOWED_ERROR_RATE changes
+_allowedErrorsTable = None
+_allowedErrorsTableRate = None
 
-    # Add the final sequence to the list (whatever's remaining)
-    if sequence != '':
-        resultList.append(sequence)
-    return resultList
+def getAllowedErrorsTable(size):
+    '''
+    @param size Integer The minimum number of entries the table must have
+    @return NumPy array in which entry i is ceil(sqrt(i)*ALLOWED_ERROR_RATE), the
+            number of errors at which overlap() gives up on an alignment after
+            comparing i+1 characters
+    '''
+    global _allowedErrorsTable, _allowedErrorsTableRate
+
+    if _allowedErrorsTable is None or _allowedErrorsTableRate != ALLOWED_ERROR_RATE \
+            or len(_allowedErrorsTable) < size:
+        # Use the same math calls as overlapPython() so that the thresholds match
+        # it exactly
+        size = max(size, 2 * (0 if _allowedErrorsTable is None else len(_allowedErrorsTable)))
+        _allowedErrorsTable = numpy.array(
+            [math.ceil(math.sqrt(i)*ALLOWED_ERROR_RATE) for i in range(size)],
+            dtype=numpy.int64 )
+        _allowedErrorsTableRate = ALLOWED_ERROR_RATE
+    return _allowedErrorsTable
+
+def encodeFragment(fragment):
+    '''
+    @param fragment String or NumPy array The DNA sequence to encode
+    @return NumPy array The sequence as an array of uint8 character codes
+    '''
+    if isinstance(fragment, str):
+        return numpy.frombuffer(fragment.encode("ascii"), dtype=numpy.uint8)
+    return fragment
+
+def getPaddedFragmentArray(fragments):
+    '''
+    @param fragments List of strings (or uint8 arrays) The DNA sequences to encode
+    @return Tuple (2-D uint8 NumPy array with one zero-padded fragment per row,
+                   NumPy array of the fragments' unpadded lengths)
+    '''
+    encoded = [encodeFragment(f) for f in fragments]
+    lengths = numpy.array([len(f) for f in encoded], dtype=numpy.int64)
+    width = int(lengths.max()) if len(encoded) > 0 else 0
+    padded = numpy.zeros((len(encoded), width), dtype=numpy.uint8)
+    for row, f in enumerate(encoded):
+        padded[row, :len(f)] = f
+    return padded, lengths
+
+def overlapNumpy( s1, s2 ):
+    '''
+    Calculates exactly the same thing as overlapPython(), but compares every
+    suffix of s1 against the prefix of s2 at once instead of one character at a
+    time.
+
+    @param s1 String or uint8 NumPy array (see encodeFragment())
+    @param s2 String or uint8 NumPy array (see encodeFragment())
+    @return Tuple (length of the overlap, index in s1 where the overlap starts)
+    '''
+    if numpy is None:
+        raise ImportError("The numpy overlap engine requires NumPy")
+
+    s2 = encodeFragment(s2)
+    scores, offsets = overlapManyNumpy(s1, s2[None, :],
+                                       numpy.array([len(s2)], dtype=numpy.int64))
+    return int(scores[0]), int(offsets[0])
+
+# overlapManyNumpy() works on blocks of roughly this many alignments at a time
+NUMPY_BLOCK_SIZE = 1 << 20
+
+# overlapManyNumpy() compares this many positions of s2 in its first step, and
+# twice as many in each step after that (up to NUMPY_MAX_STEP)
+NUMPY_FIRST_STEP = 2
+NUMPY_MAX_STEP = 64
+
+def overlapManyNumpy( s1, padded, lengths ):
+    '''
+    Calculates overlap(s1, s2) for every fragment s2 in a padded fragment array.
+
+    Every alignment (each fragment against each suffix of s1) is compared a few
+    positions at a time, and, like overlapPython(), an alignment is dropped as
+    soon as an error pushes it to its allowance. Most alignments of unrelated
+    sequences are dropped within the first couple of positions, so the work
+    done is close to that of overlapPython(), but in a handful of array
+    operations per step rather than one Python statement per character.
+
+    @param s1 String or uint8 NumPy array (see encodeFragment())
+    @param padded 2-D uint8 NumPy array The fragments to use as s2, one per row
+    @param lengths NumPy array The unpadded length of each row of padded
+    @return Tuple (NumPy array of overlap lengths, NumPy array of the indices in
+                   s1 where each overlap starts), with one entry per row of padded
+    '''
+    s1 = encodeFragment(s1)
+    len1 = len(s1)
+    numRows = len(lengths)
+    scores = numpy.zeros(numRows, dtype=numpy.int64)
+    offsets = numpy.full(numRows, len1, dtype=numpy.int64)
+    if len1 == 0 or numRows == 0 or padded.shape[1] == 0:
+        return scores, offsets
+
+    # Alignments shorter than MIN_OVERLAP_LENGTH can't count, so don't try the
+    # suffixes of s1 shorter than that
+    firstLength = 1 if MIN_OVERLAP_LENGTH is None else max(1, MIN_OVERLAP_LENGTH)
+    if firstLength > len1:
+        return scores, offsets
+
+    width = padded.shape[1]
+    allowedErrors = getAllowedErrorsTable(width + NUMPY_MAX_STEP + 1)
+    suffixLengths = numpy.arange(firstLength, len1 + 1)
+    numShifts = len(suffixLengths)
+    # Each alignment's score (the number of positions it compares) and the suffix
+    # of s1 it uses are packed into a single key, so that the best alignment of
+    # each row is the one with the largest key: the highest score and then, like
+    # overlapPython(), the shortest suffix
+    bestKeys = numpy.zeros(numRows, dtype=numpy.int64)
+    numComparisons = 0
+
+    blockRows = max(1, NUMPY_BLOCK_SIZE // numShifts)
+    for first in range(0, numRows, blockRows):
+        last = min(first + blockRows, numRows)
+        # One entry per alignment still being compared
+        rows = numpy.repeat(numpy.arange(first, last), numShifts)
+        suffixLength = numpy.tile(suffixLengths, last - first)
+        numCompared = numpy.minimum(suffixLength, lengths[rows])
+        live = numCompared > 0
+        rows = rows[live]
+        suffixLength = suffixLength[live]
+        numCompared = numCompared[live]
+        errorsSoFar = numpy.zeros(len(rows), dtype=numpy.int64)
+
+        position = 0
+        step = NUMPY_FIRST_STEP
+        while len(rows) > 0:
+            s2Positions = position + numpy.arange(step)
+            compared = s2Positions < numCompared[:, None]
+            s2Chars = padded[rows[:, None], numpy.minimum(s2Positions, width - 1)]
+            s1Chars = s1[numpy.minimum((len1 - suffixLength)[:, None] + s2Positions,
+                                       len1 - 1)]
+            mismatches = (s1Chars != s2Chars) & compared
+            errors = errorsSoFar[:, None] + numpy.cumsum(mismatches, axis=1)
+            numComparisons += len(rows) * step
+
+            # overlapPython() gives up on an alignment as soon as an error pushes it
+            # to its allowance...
+            rejected = (mismatches & (errors >= allowedErrors[s2Positions])).any(axis=1)
+            errorsSoFar = errors[:, -1]
+
+            # ...and otherwise checks the total against the allowance at the
+            # position where it stopped comparing
+            finished = ~rejected & (numCompared <= position + step)
+            stoppedAt = numpy.where(suffixLength > lengths[rows], numCompared,
+                                    numCompared - 1)
+            accepted = finished & (errorsSoFar < allowedErrors[stoppedAt])
+            keys = numCompared[accepted] * (len1 + 1) + (len1 - suffixLength[accepted])
+            numpy.maximum.at(bestKeys, rows[accepted], keys)
+
+            keep = ~rejected & ~finished
+            rows = rows[keep]
+            suffixLength = suffixLength[keep]
+            numCompared = numCompared[keep]
+            errorsSoFar = errorsSoFar[keep]
+            position += step
+            step = min(2 * step, NUMPY_MAX_STEP)
+
+    if instrumentation.ENABLED:
+        instrumentation.count("overlap.numpyPairs", numRows)
+        instrumentation.count("overlap.numpyComparisons", numComparisons)
+
+    found = bestKeys > 0
+    scores[found] = bestKeys[found] // (len1 + 1)
+    offsets[found] = bestKeys[found] % (len1 + 1)
+    if MIN_OVERLAP_LENGTH is not None:
+        tooShort = scores < MIN_OVERLAP_LENGTH
+        scores[tooShort] = 0
+        offsets[tooShort] = len1
+
+    return scores, offsets
+
+
+# Translation tables for getReverseCompliment(): one complements each base, the
+# other deletes them all (so that anything left over is a non-DNA letter)
+COMPLIMENT_TABLE = str.maketrans("ACGT", "TGCA")
+DNA_DELETION_TABLE = str.maketrans("", "", "ACGT")
+
+def getReverseCompliment(string):
+    '''
+    @param string String The DNA sequence for which we should calculate the
+                         reverse compliment
+    @return String The reverse compliment of the input string
+    '''
+    nonDNA = string.translate(DNA_DELETION_TABLE)
+    if nonDNA != "":
+        print("ERROR! Non-DNA letter",nonDNA[0],"found in your FASTA data.")
+        exit()
+    return string.translate(COMPLIMENT_TABLE)[::-1]
+
+def getFragments(file, useMmap=False):
+    '''
+    @param file String The (possibly gzipped) FASTA file to read
+    @param useMmap Boolean Whether to memory-map the file (see readfasta.iterfasta)
+    @return List of strings The sequences longer than MIN_LENGTH
+    '''
+    return [sequence for label, header, sequence in iterfasta(file, useMmap)
+            if len(sequence) > MIN_LENGTH]
 
 def getDuplicateMatrix( matrixToCopy ):
     m = []
@@ -127,37 +457,376 @@ def getDuplicateMatrix( matrixToCopy ):
     return m
 
 
-def getOverlapMatrix(fragments):
-    numSeqs = len(fragments)
-    overlapMatrix = [ [0] * numSeqs for i in range(numSeqs) ]
+def prepareColumns(columnFragments, engine):
+    '''
+    @return The column fragments in the form computeMatrixRows() expects for
+            the given engine
+    '''
+    if engine == "numpy":
+        return getPaddedFragmentArray(columnFragments)
+    return columnFragments
 
-    # Creating a matrix of the overlap distances
-    # Comparing all fragments to one another
-    for i in range(numSeqs):
-        for j in range(numSeqs):
-            overlapMatrix[i][j], theOffset = overlap(fragments[i],fragments[j])
+def computeCandidateOverlaps(s1, columns, candidateColumns, engine):
+    '''
+    With the "numpy" engine, s1 is scored against all the candidate columns of
+    the padded fragment array in one call to overlapManyNumpy().
 
-    return overlapMatrix
+    @param columns The column fragments, as returned by prepareColumns()
+    @param candidateColumns List of integers (or a range) The columns to compare
+                                                           s1 against
+    @return Tuple (list of overlap lengths, list of offsets), one entry per
+            candidate column
+    '''
+    if engine == "numpy":
+        padded, lengths = columns
+        if isinstance(candidateColumns, range) and candidateColumns.step == 1:
+            # A slice is a view, so the padded array isn't copied for every row
+            candidateColumns = slice(candidateColumns.start, candidateColumns.stop)
+        scores, offsets = overlapManyNumpy(s1, padded[candidateColumns],
+                                           lengths[candidateColumns])
+        return scores.tolist(), offsets.tolist()
 
-def getRevCompMatrix(fragments):
-    numSeqs = len(fragments)
-    revCompMatrix = [ [0] * numSeqs for i in range(numSeqs) ]
+    scores = []
+    offsets = []
+    for j in candidateColumns:
+        theOverlap, theOffset = overlap(s1, columns[j], engine)
+        scores.append(theOverlap)
+        offsets.append(theOffset)
+    return scores, offsets
+
+def computeMatrixRows(rowFragments, columns, first, last, engine, candidates=None):
+    '''
+    Calculates overlap(rowFragments[i], s2) for first <= i < last and every s2 in
+    the columns.
+
+    @param columns The column fragments, as returned by prepareColumns()
+    @param candidates List of lists If given, only the columns in candidates[i]
+                                    are compared against rowFragments[i]; the
+                                    rest are scored as not overlapping
+    @return Tuple (first, rows of the overlap matrix, rows of the offset matrix)
+    '''
+    numColumns = len(columns[1]) if engine == "numpy" else len(columns)
+    overlapRows = []
+    offsetRows = []
+    for i in range(first, last):
+        if candidates is None:
+            overlapRow, offsetRow = computeCandidateOverlaps(rowFragments[i], columns,
+                                                             range(numColumns), engine)
+        else:
+            overlapRow = [0] * numColumns
+            offsetRow = [len(rowFragments[i])] * numColumns
+            scores, offsets = computeCandidateOverlaps(rowFragments[i], columns,
+                                                       candidates[i], engine)
+            for j, score, offset in zip(candidates[i], scores, offsets):
+                overlapRow[j] = score
+                offsetRow[j] = offset
+        overlapRows.append(overlapRow)
+        offsetRows.append(offsetRow)
+    return first, overlapRows, offsetRows
+
+def getSeedCandidates(rowFragments, columnFragments, seedLength, window=None):
+    '''
+    @param window Integer The seed filter's window (default: SEED_FILTER_WINDOW)
+    @return The candidate columns for each row, as returned by
+            team_3_seedFilter.getCandidatePairs(), after reporting how many pairs
+            the seed filter pruned
+    '''
+    if window is None:
+        window = SEED_FILTER_WINDOW
+    candidates = getCandidatePairs(rowFragments, columnFragments, seedLength, window)
+    numPairs = len(rowFragments) * len(columnFragments)
+    numPruned = numPairs - sum(len(c) for c in candidates)
+    print("Seed filter skipped", numPruned, "of", numPairs, "pairs.")
+    return candidates
+
+def getSparsePairwiseMatrices(rowFragments, columnFragments, seedLength=None,
+                              engine=None, verify=False, window=None):
+    '''
+    Like getPairwiseMatrices(), but only scores the pairs which pass the seed
+    filter, and only stores the pairs which overlap.
+
+    @param seedLength Integer The k-mer length of the seed filter (default:
+                              SEED_FILTER_LENGTH, or team_3_seedFilter.SEED_LENGTH
+                              if that isn't set)
+    @param window Integer The seed filter's window (default: SEED_FILTER_WINDOW)
+    @param verify Boolean Whether to also run overlap() on every pruned pair to
+                          check that the filter didn't miss anything
+    @return Tuple (overlap rows, offset rows, statistics). Row i of each is a
+            dictionary mapping column j to the overlap length or offset of
+            overlap(rowFragments[i], columnFragments[j]); a missing column means
+            an overlap of 0 at offset len(rowFragments[i]). The statistics are
+            a dictionary with the number of "pairs", "candidates" and "pruned",
+            plus (if verifying) the number of pruned pairs which actually
+            overlap ("missed") and the longest such overlap ("maxMissedOverlap").
+    '''
+    if engine is None:
+        engine = OVERLAP_ENGINE
+    if seedLength is None:
+        seedLength = SEED_FILTER_LENGTH
+    if seedLength is None:
+        seedLength = SEED_LENGTH
+    if window is None:
+        window = SEED_FILTER_WINDOW
+    candidates = getCandidatePairs(rowFragments, columnFragments, seedLength, window)
+
+    columns = prepareColumns(columnFragments, engine)
+    overlapRows = []
+    offsetRows = []
+    stats = { "pairs": len(rowFragments) * len(columnFragments),
+              "candidates": sum(len(c) for c in candidates) }
+    stats["pruned"] = stats["pairs"] - stats["candidates"]
+    if verify:
+        stats["missed"] = 0
+        stats["maxMissedOverlap"] = 0
+
+    for i, s1 in enumerate(rowFragments):
+        scores, offsets = computeCandidateOverlaps(s1, columns, candidates[i], engine)
+        overlapRows.append(dict((j, score) for j, score in zip(candidates[i], scores)
+                                if score > 0))
+        offsetRows.append(dict((j, offset) for j, offset, score
+                               in zip(candidates[i], offsets, scores) if score > 0))
+
+        if verify:
+            candidateSet = set(candidates[i])
+            pruned = [j for j in range(len(columnFragments)) if j not in candidateSet]
+            scores, offsets = computeCandidateOverlaps(s1, columns, pruned, engine)
+            for score in scores:
+                if score > 0:
+                    stats["missed"] += 1
+                    stats["maxMissedOverlap"] = max(stats["maxMissedOverlap"], score)
+
+    return overlapRows, offsetRows, stats
+
+# The fragments each worker process compares, set once by initMatrixWorker() so
+# that they don't have to be sent along with every block of rows
+_workerRowFragments = None
+_workerColumns = None
+_workerEngine = None
+_workerCandidates = None
+
+def initMatrixWorker(rowFragments, columnFragments, engine, allowedErrorRate,
+                     candidates=None, indelErrorRate=None, minOverlapLength=None):
+    global _workerRowFragments, _workerColumns, _workerEngine, _workerCandidates, \
+           ALLOWED_ERROR_RATE, INDEL_ERROR_RATE, MIN_OVERLAP_LENGTH
+    ALLOWED_ERROR_RATE = allowedErrorRate
+    if indelErrorRate is not None:
+        INDEL_ERROR_RATE = indelErrorRate
+    MIN_OVERLAP_LENGTH = minOverlapLength
+    _workerRowFragments = rowFragments
+    _workerColumns = prepareColumns(columnFragments, engine)
+    _workerEngine = engine
+    _workerCandidates = candidates
+
+def computeMatrixRowsInWorker(first, last):
+    return computeMatrixRows(_workerRowFragments, _workerColumns, first, last,
+                             _workerEngine, _workerCandidates)
+
+# The OverlapCache the matrix builders consult by default; set by main()
+overlapCache = None
+
+def getOverlapCacheTag(engine=None):
+    '''
+    @return String The settings a cached result of overlap() with the given
+            engine (default: OVERLAP_ENGINE) depends on
+    '''
+    if engine is None:
+        engine = OVERLAP_ENGINE
+    tag = "ALLOWED_ERROR_RATE=" + repr(ALLOWED_ERROR_RATE)
+    if engine == "bitparallel":
+        tag = "bitparallel INDEL_ERROR_RATE=" + repr(INDEL_ERROR_RATE)
+    # The other engines all give the same results
+    if MIN_OVERLAP_LENGTH is not None:
+        tag += " MIN_OVERLAP_LENGTH=" + repr(MIN_OVERLAP_LENGTH)
+    return tag
+
+def splitCachedPairs(cache, rowFragments, columnFragments, candidates):
+    '''
+    Looks up every pair to be scored in the cache.
+
+    @return Tuple (the candidate columns of each row which aren't cached, and for
+                   each row a dictionary mapping the cached columns to their
+                   (overlap length, offset)). A row with nothing cached keeps
+                   its candidates as they were, and if nothing at all was cached
+                   and there were no candidates, they stay None.
+    '''
+    missing = []
+    cached = []
+    for i, s1 in enumerate(rowFragments):
+        rowCandidates = range(len(columnFragments)) if candidates is None \
+                        else candidates[i]
+        rowMissing = []
+        rowCached = {}
+        for j in rowCandidates:
+            result = cache.get(s1, columnFragments[j])
+            if result is None:
+                rowMissing.append(j)
+            else:
+                rowCached[j] = result
+        # Keep a range as it is, so the "numpy" engine can score a view of it
+        missing.append(rowMissing if len(rowCached) > 0 else rowCandidates)
+        cached.append(rowCached)
+    if candidates is None and not any(cached):
+        missing = None
+    return missing, cached
+
+def mergeCachedPairs(cache, rowFragments, columnFragments, missing, cached,
+                     overlapMatrix, offsetMatrix):
+    '''
+    Adds the newly computed pairs to the cache, and fills the cached pairs into
+    the matrices.
+    '''
+    for i, s1 in enumerate(rowFragments):
+        rowMissing = range(len(columnFragments)) if missing is None else missing[i]
+        for j in rowMissing:
+            cache.put(s1, columnFragments[j], (overlapMatrix[i][j], offsetMatrix[i][j]))
+        for j, (theOverlap, theOffset) in cached[i].items():
+            overlapMatrix[i][j] = theOverlap
+            offsetMatrix[i][j] = theOffset
+
+@instrumentation.timed("build matrices")
+def getPairwiseMatrices(rowFragments, columnFragments, engine=None, workers=None,
+                        seedLength=None, cache=None, tileDirectory=None):
+    '''
+    @param rowFragments List of strings The fragments to use as s1 in overlap()
+    @param columnFragments List of strings The fragments to use as s2 in overlap()
+    @param engine String The overlap() engine to use (default: OVERLAP_ENGINE)
+    @param workers Integer The number of processes to use (default: NUM_WORKERS)
+    @param seedLength Integer If set, only score the pairs which share a k-mer of
+                              this length (default: SEED_FILTER_LENGTH), within
+                              SEED_FILTER_WINDOW of the ends if that's set
+    @param cache OverlapCache Pairs found in it aren't recomputed, and the pairs
+                              which aren't are added to it (default:
+                              overlapCache; False for no cache). A cache tagged
+                              for a different engine or error rate is ignored.
+    @param tileDirectory String If set, compute the matrices in tiles checkpointed
+                                under this directory (default:
+                                MATRIX_TILE_DIRECTORY; False for no tiles)
+    @return Tuple (overlap matrix, offset matrix). Entry [i][j] of each is the
+            length and starting offset, respectively, of
+            overlap(rowFragments[i], columnFragments[j]).
+    '''
+    if engine is None:
+        engine = OVERLAP_ENGINE
+    if workers is None:
+        workers = NUM_WORKERS
+    if seedLength is None:
+        seedLength = SEED_FILTER_LENGTH
+    if tileDirectory is None:
+        tileDirectory = MATRIX_TILE_DIRECTORY
+    if tileDirectory:
+        import team_3_tiledMatrix
+        return team_3_tiledMatrix.getTiledPairwiseMatrices(
+            rowFragments, columnFragments, tileDirectory, engine, workers, seedLength)
+    if cache is None:
+        cache = overlapCache
+    if cache is False or (cache is not None and cache.tag is not None
+                          and cache.tag != getOverlapCacheTag(engine)):
+        cache = None
+    if cache is not None and len(rowFragments) * len(columnFragments) > cache.maxSize:
+        cache = None
+
+    candidates = None
+    if seedLength is not None:
+        candidates = getSeedCandidates(rowFragments, columnFragments, seedLength)
+    if cache is not None:
+        candidates, cached = splitCachedPairs(cache, rowFragments, columnFragments,
+                                              candidates)
+
+    numRows = len(rowFragments)
+    if workers <= 1 or numRows < 2:
+        columns = prepareColumns(columnFragments, engine)
+        first, overlapMatrix, offsetMatrix = \
+            computeMatrixRows(rowFragments, columns, 0, numRows, engine, candidates)
+        if cache is not None:
+            mergeCachedPairs(cache, rowFragments, columnFragments, candidates, cached,
+                             overlapMatrix, offsetMatrix)
+        return overlapMatrix, offsetMatrix
 
+    overlapMatrix = [None] * numRows
+    offsetMatrix = [None] * numRows
+    rowsPerBlock = max(1, -(-numRows // (workers * BLOCKS_PER_WORKER)))
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=initMatrixWorker,
+            initargs=(rowFragments, columnFragments, engine, ALLOWED_ERROR_RATE,
+                      candidates, INDEL_ERROR_RATE, MIN_OVERLAP_LENGTH)) as pool:
+        blocks = [ pool.submit(computeMatrixRowsInWorker, first,
+                               min(first + rowsPerBlock, numRows))
+                   for first in range(0, numRows, rowsPerBlock) ]
+        for block in concurrent.futures.as_completed(blocks):
+            first, overlapRows, offsetRows = block.result()
+            overlapMatrix[first:first + len(overlapRows)] = overlapRows
+            offsetMatrix[first:first + len(offsetRows)] = offsetRows
+
+    if cache is not None:
+        mergeCachedPairs(cache, rowFragments, columnFragments, candidates, cached,
+                         overlapMatrix, offsetMatrix)
+    return overlapMatrix, offsetMatrix
+
+def getOverlapAndOffsetMatrices(fragments, engine=None, workers=None):
+    '''
+    Compares all fragments to one another in a single pass.
+
+    @param fragments List of strings The DNA sequences to compare
+    @param engine String The overlap() engine to use (default: OVERLAP_ENGINE)
+    @param workers Integer The number of processes to use (default: NUM_WORKERS)
+    @return Tuple (overlap matrix, offset matrix). Entry [i][j] of each is the
+            length and starting offset, respectively, of overlap(fragments[i],
+            fragments[j]).
+    '''
+    return getPairwiseMatrices(fragments, fragments, engine, workers)
+
+def getOverlapMatrix(fragments, workers=None):
+    overlapMatrix, offsetMatrix = getOverlapAndOffsetMatrices(fragments, workers=workers)
+    return overlapMatrix
+
+def getRevCompMatrix(fragments, workers=None):
     # Create a matrix of the overlap distances if each fragment, in turn,
     # is treated as part of the anti-sense strand
-    for i in range(len(fragments)):
-        revCompOfI = getReverseCompliment(fragments[i])
-        for j in range(len(fragments)):
-            revCompMatrix[i][j], theOffset = overlap(revCompOfI,fragments[j])
-
+    revComps = [getReverseCompliment(f) for f in fragments]
+    revCompMatrix, offsetMatrix = getPairwiseMatrices(revComps, fragments,
+                                                      workers=workers)
     return revCompMatrix
 
+def getSenseAndAntisenseMatrices(fragments, engine=None, workers=None):
+    '''
+    Builds the overlap matrix and the reverse-compliment matrix in one sweep over
+    the fragments: each fragment and its reverse compliment are both
+    compared against every fragment as s1.
+
+    @param engine String The overlap() engine to use (default: OVERLAP_ENGINE)
+    @param workers Integer The number of processes to use (default: NUM_WORKERS)
+    @return Tuple (overlap matrix, offset matrix, reverse-compliment matrix), as
+            returned by getOverlapAndOffsetMatrices() and getRevCompMatrix()
+    '''
+    numSeqs = len(fragments)
+    revComps = [getReverseCompliment(f) for f in fragments]
+    overlapRows, offsetRows = getPairwiseMatrices(list(fragments) + revComps,
+                                                  fragments, engine, workers)
+    return overlapRows[:numSeqs], offsetRows[:numSeqs], overlapRows[numSeqs:]
+
 def negateMainDiagonal(squareMatrix):
     for i in range(len(squareMatrix)):
         squareMatrix[i][i] = -squareMatrix[i][i]
     return squareMatrix
 
-def removeDuplicates(fragments):
+@instrumentation.timed("remove duplicates")
+def removeDuplicates(fragments, engine=None):
+    '''
+    @param fragments List of strings The DNA sequences to filter
+    @param engine String "index" or "scan" (default: CONTAINMENT_ENGINE)
+    @return List of strings The fragments which aren't contained in any other
+            fragment. A fragment which appears more than once is removed
+            entirely.
+    '''
+    if engine is None:
+        engine = CONTAINMENT_ENGINE
+
+    if engine == "index":
+        contained = getContainedFragmentIndices(fragments)
+        return [f for i, f in enumerate(fragments) if i not in contained]
+    elif engine != "scan":
+        raise ValueError("Unknown containment engine: " + str(engine))
+
     workingFragmentList = list(fragments)
     for i in range(len(fragments)):
         for j in range(len(fragments)):
@@ -166,63 +835,218 @@ def removeDuplicates(fragments):
                 break
     return workingFragmentList
 
+def getAliveMax(matrix, index, alive, byColumn):
+    '''
+    @param matrix List of lists (or NumPy array) The overlap or
+                  reverse-compliment matrix
+    @param index Integer The row (or column) to search
+    @param alive List of booleans (a NumPy array, if the matrix is one) Which
+                 fragments haven't been removed yet
+    @param byColumn Boolean Whether to search column index instead of row index
+    @return Tuple (the largest value in the row or column among the fragments
+            still alive, treating the main diagonal as negated as in
+            negateMainDiagonal(), the index at which it was found)
+    '''
+    if numpy is not None and isinstance(matrix, numpy.ndarray):
+        values = numpy.array(matrix[:, index] if byColumn else matrix[index],
+                             dtype=numpy.int64)
+        values[index] = -values[index]
+        aliveIndices = numpy.flatnonzero(alive)
+        if len(aliveIndices) == 0:
+            return None, index
+        # argmax() picks the first of equal values, as the loop below does
+        bestAt = int(aliveIndices[numpy.argmax(values[aliveIndices])])
+        return int(values[bestAt]), bestAt
+
+    best = None
+    bestAt = index
+    for j in range(len(alive)):
+        if not alive[j]:
+            continue
+        value = matrix[j][index] if byColumn else matrix[index][j]
+        if j == index:
+            value = -value
+        if best is None or value > best:
+            best = value
+            bestAt = j
+    return best, bestAt
+
+def getSubmatrix(matrix, indices):
+    '''
+    @param indices List of integers The rows (and columns) to keep
+    @return The square submatrix: sliced with numpy.ix_() if the matrix is a
+            NumPy array (e.g. memory-mapped), otherwise a list of lists
+    '''
+    if numpy is not None and isinstance(matrix, numpy.ndarray):
+        return numpy.asarray(matrix)[numpy.ix_(indices, indices)]
+    return [[matrix[i][j] for j in indices] for i in indices]
+
+def reportAntisenseIteration(iteration, numDeletedFragments):
+    if iteration == 0:
+        print("Decided that",numDeletedFragments,
+              "fragments belong on the anti-sense strand.")
+    else:
+        print("Decided another",numDeletedFragments,
+              "fragments belong on the anti-sense strand.")
+
+def removeAntisenseFragmentsIncrementally(fragments, overlapMatrix, revCompMatrix,
+                                          maxIterations=None):
+    '''
+    Does the same pruning as removeAntisenseFragments(), but from matrices that
+    were computed once for all the fragments. Removed fragments are masked out,
+    and only the row and column maxima that came from a removed fragment are
+    searched for again.
+
+    @param overlapMatrix Matrix The (un-negated) overlap matrix
+    @param revCompMatrix Matrix The (un-negated) reverse-compliment matrix
+    @param maxIterations Integer The most times to prune; None means to keep
+                                 going until nothing changes
+    @return List of integers The indices of the fragments that survived
+    '''
+    numSeqs = len(fragments)
+    if numpy is not None:
+        # Search whole rows and columns at once in getAliveMax()
+        overlapMatrix = numpy.asarray(overlapMatrix)
+        revCompMatrix = numpy.asarray(revCompMatrix)
+        alive = numpy.ones(numSeqs, dtype=bool)
+    else:
+        alive = [True] * numSeqs
+
+    # The running maxima, as (value, index found at) tuples: overlap when first,
+    # overlap when second, and the same for the reverse compliments
+    searches = [ (overlapMatrix, False), (overlapMatrix, True),
+                 (revCompMatrix, False), (revCompMatrix, True) ]
+    maxima = [ [getAliveMax(matrix, i, alive, byColumn) for i in range(numSeqs)]
+               for matrix, byColumn in searches ]
+
+    iteration = 0
+    while maxIterations is None or iteration < maxIterations:
+        with instrumentation.stage("anti-sense pruning iteration"):
+            # Remove any fragment which aligns better as part of the anti-sense strand
+            toRemove = []
+            for i in range(numSeqs):
+                if not alive[i]:
+                    continue
+                maxWhenFirst = maxima[0][i][0]
+                maxWhenSecond = max(-1, maxima[1][i][0])
+                revCompMaxWhenFirst = maxima[2][i][0]
+                revCompMaxWhenSecond = max(-1, maxima[3][i][0])
+                if (maxWhenFirst < revCompMaxWhenFirst) \
+                        and (maxWhenSecond < revCompMaxWhenSecond):
+                    toRemove.append(i)
+
+            reportAntisenseIteration(iteration, len(toRemove))
+            iteration += 1
+            if len(toRemove) == 0:
+                break
+
+            for i in toRemove:
+                alive[i] = False
+
+            # Removing fragments can only lower a maximum, and only if it was found
+            # at one of the removed fragments
+            for (matrix, byColumn), searchMaxima in zip(searches, maxima):
+                for i in range(numSeqs):
+                    if alive[i] and not alive[searchMaxima[i][1]]:
+                        searchMaxima[i] = getAliveMax(matrix, i, alive, byColumn)
+
+    return [i for i in range(numSeqs) if alive[i]]
+
+@instrumentation.timed("remove anti-sense fragments")
+def removeAntisenseFragments(fragments, incremental=None, maxIterations=None):
+    '''
+    Iterate to make sure we remove anything that aligns better on the antisense
+    strand than the sense strand.
+
+    @param fragments List of strings The fragments, with duplicates removed
+    @param incremental Boolean Whether to compute the matrices only once (default:
+                               INCREMENTAL_PRUNING)
+    @param maxIterations Integer The most times to prune (default:
+                                 ANTISENSE_MAX_ITERATIONS)
+    @return Tuple (the surviving fragments, their overlap matrix, their offset
+                   matrix). With NumPy, the incremental pruning returns the
+                   matrices as arrays.
+    '''
+    if incremental is None:
+        incremental = INCREMENTAL_PRUNING
+    if maxIterations is None:
+        maxIterations = ANTISENSE_MAX_ITERATIONS
+
+    if incremental:
+        overlapMatrix, offsetMatrix, revCompMatrix = \
+            getSenseAndAntisenseMatrices( fragments )
+        survivors = removeAntisenseFragmentsIncrementally(
+            fragments, overlapMatrix, revCompMatrix, maxIterations )
+        return [fragments[i] for i in survivors], \
+               getSubmatrix(overlapMatrix, survivors), \
+               getSubmatrix(offsetMatrix, survivors)
+
+    workingFragmentList = list(fragments)
+    if maxIterations is None:
+        maxIterations = 4
+    for iteration in range(maxIterations):
+        with instrumentation.stage("anti-sense pruning iteration"):
+            overlapMatrix, offsetMatrix, revCompMatrix = \
+                getSenseAndAntisenseMatrices( workingFragmentList )
+            overlapMatrix = negateMainDiagonal( overlapMatrix )
+            revCompMatrix = negateMainDiagonal( revCompMatrix )
+
+            # Remove from the list of fragments any fragment which aligns better as part
+            # of the anti-sense strand
+            for i in range(len(fragments)):
+                maxWhenFirst = max(overlapMatrix[i])
+                maxWhenSecond = -1
+                for row in overlapMatrix:
+                    maxWhenSecond = max(maxWhenSecond, row[i])
+
+                revCompMaxWhenFirst = max(revCompMatrix[i])
+                revCompMaxWhenSecond = -1
+                for row in revCompMatrix:
+                    revCompMaxWhenSecond = max(revCompMaxWhenSecond, row[i])
+
+                #if (maxWhenFirst + maxWhenSecond) < (revCompMaxWhenFirst + revCompMaxWhenSecond):
+                if (maxWhenFirst < revCompMaxWhenFirst) \
+                        and (maxWhenSecond < revCompMaxWhenSecond):
+                    workingFragmentList.remove(fragments[i])
+
+            # "Delete" our knowledge of any fragments which we've decided to treat as part
+            # of the antisense strand
+            reportAntisenseIteration(iteration, len(fragments) - len(workingFragmentList))
+            fragments = list(workingFragmentList)
+
+    # Using that new, trimmed-down list of fragments, recreate the overlap matrix,
+    # keeping the offsets so that later stages don't have to recompute them
+    overlapMatrix, offsetMatrix = getOverlapAndOffsetMatrices( fragments )
+    return fragments, overlapMatrix, offsetMatrix
+
 def main():
-    workingFragmentList = getFragments('fragments.fasta')
-    workingFragmentList = removeDuplicates(workingFragmentList)
-    fragments = list(workingFragmentList)
-
-    #### TODO: Should we actually be iterating this a few times? ####
-    # Iterate to make sure we remove anything that aligns better on the antisense
-    # strand than the sense strand
-    for iteration in range(4):
-        overlapMatrix = negateMainDiagonal( getOverlapMatrix( workingFragmentList ) )
-        revCompMatrix = negateMainDiagonal( getRevCompMatrix( workingFragmentList ) )
-
-        # Remove from the list of fragments any fragment which aligns better as part
-        # of the anti-sense strand
-        for i in range(len(fragments)):
-            maxWhenFirst = max(overlapMatrix[i])
-            maxWhenSecond = -1
-            for row in overlapMatrix:
-                maxWhenSecond = max(maxWhenSecond, row[i])
-
-            revCompMaxWhenFirst = max(revCompMatrix[i])
-            revCompMaxWhenSecond = -1
-            for row in revCompMatrix:
-                revCompMaxWhenSecond = max(revCompMaxWhenSecond, row[i])
-
-            #if (maxWhenFirst + maxWhenSecond) < (revCompMaxWhenFirst + revCompMaxWhenSecond):
-            if (maxWhenFirst < revCompMaxWhenFirst) \
-                    and (maxWhenSecond < revCompMaxWhenSecond):
-                workingFragmentList.remove(fragments[i])
+    global overlapCache
+    if OVERLAP_CACHE_FILE is not None:
+        overlapCache = loadOverlapCache(OVERLAP_CACHE_FILE, OVERLAP_CACHE_SIZE,
+                                        getOverlapCacheTag())
+        print("Loaded", len(overlapCache), "cached overlaps.")
 
-        # "Delete" our knowledge of any fragments which we've decided to treat as part
-        # of the antisense strand
-        numDeletedFragments = len(fragments) - len(workingFragmentList)
-        if iteration == 0:
-            print("Decided that",numDeletedFragments,
-                  "fragments belong on the anti-sense strand.")
-        else:
-            print("Decided another",numDeletedFragments,
-                  "fragments belong on the anti-sense strand.")
-        fragments = list(workingFragmentList)
+    with instrumentation.stage("parse"):
+        allFragments = [sequence for label, header, sequence
+                        in iterfasta('fragments.fasta')]
+    fragments = [f for f in allFragments if len(f) > MIN_LENGTH]
+    deduplicatedFragments = removeDuplicates(fragments)
 
-        #### End possible for loop ####
+    fragments, overlapMatrix, offsetMatrix = \
+        removeAntisenseFragments( deduplicatedFragments )
 
     print("After removing duplicated content and fragments that fit better on the "
           + "anti-sense strand, we have", len(fragments), "fragments.")
 
-    # Using that new, trimmed-down list of fragments, recreate the overlap matrix
-    overlapMatrix = getOverlapMatrix( fragments )
-
-
-    # Write the matrix to disk
-    overlapFile = open("overlap.txt", "w")
-    for row in overlapMatrix:
-        for col in row:
-            overlapFile.write(str(col))
-            overlapFile.write(" ")
-        overlapFile.write("\n")
+    # Write the matrices to disk
+    writeMatrix("overlap.npy", overlapMatrix)
+    writeMatrix("offsets.npy", offsetMatrix)
+    if WRITE_TEXT_MATRICES:
+        writeTextMatrix("overlap.txt", overlapMatrix)
+        writeTextMatrix("offsets.txt", offsetMatrix)
+    if MATRIX_TILE_DIRECTORY:
+        import team_3_tiledMatrix
+        team_3_tiledMatrix.removeFinishedJobs(MATRIX_TILE_DIRECTORY)
 
     # Write the fragment file to disk
     fragmentFile = open("fragments.txt", "w")
@@ -230,7 +1054,20 @@ def main():
         fragmentFile.write(f)
         fragmentFile.write("\n")
 
-    print("\nWrote the output file. Now run the team_3_tsp.py program in python2.")
+    # Also write every fragment, along with which filter removed it, to a binary
+    # store that later stages can memory-map
+    writeFragmentStore(FRAGMENT_STORE_FILE, allFragments,
+                       getFilterFlags(allFragments, MIN_LENGTH,
+                                      deduplicatedFragments, fragments),
+                       MIN_LENGTH)
+
+    if overlapCache is not None:
+        overlapCache.save(OVERLAP_CACHE_FILE)
+        stats = overlapCache.getStats()
+        print("Overlap cache:", stats["hits"], "hits,", stats["misses"], "misses,",
+              stats["evictions"], "evictions.")
+
+    print("\nWrote the output file. Now run the team_3_tsp.py program.")
 
 
     #print("Testing: best score of alignment for GGATGTCCTGATCCAACATCGAGGTCGTAAACCCTATTGTTGA and TCCAACATC is:")
@@ -0,0 +1,66 @@
+'''
+A k-mer seed index used to skip the overlap computation for pairs of fragments
+which can't overlap by much: a pair is only worth scoring if the first fragment
+shares a k-mer with the second. By default the k-mers of the whole fragments are
+compared; with a window, only those in the last window characters of the first
+fragment and the first window characters of the second, where an overlap of up
+to that length has to be.
+
+Note that this is a heuristic. An overlap shorter than the seed length (or one
+with an error in every seed-length window) is missed; use the verify option of
+team_3_scoreAlignments.getSparsePairwiseMatrices() to count how often that
+happens for your data.
+
+Written for Python 3
+'''
+
+# The default k-mer length used to find candidate pairs
+SEED_LENGTH = 8
+
+def getKmers(sequence, seedLength):
+    return set(sequence[start:start + seedLength]
+               for start in range(len(sequence) - seedLength + 1))
+
+def buildSeedIndex(fragments, seedLength=SEED_LENGTH, window=None):
+    '''
+    @param fragments List of strings The fragments to use as the second (s2)
+                                     argument of overlap()
+    @param seedLength Integer The k-mer length
+    @param window Integer Only index k-mers in this many characters at the start
+                          of each fragment (default: the whole fragment)
+    @return Dictionary mapping each k-mer to the list of indices of the fragments
+            whose prefix contains it
+    '''
+    index = {}
+    for i, fragment in enumerate(fragments):
+        prefix = fragment if window is None else fragment[:window]
+        for kmer in getKmers(prefix, seedLength):
+            index.setdefault(kmer, []).append(i)
+    return index
+
+def getCandidateColumns(fragment, index, seedLength=SEED_LENGTH, window=None):
+    '''
+    @param fragment String The fragment to use as the first (s1) argument of
+                           overlap()
+    @param index Dictionary The seed index of the s2 fragments, from
+                            buildSeedIndex()
+    @param window Integer Only look up k-mers in this many characters at the end
+                          of the fragment (default: the whole fragment)
+    @return Sorted list of the indices of the s2 fragments which share a k-mer
+            with the fragment's suffix
+    '''
+    suffix = fragment if window is None else fragment[-window:]
+    candidates = set()
+    for kmer in getKmers(suffix, seedLength):
+        candidates.update(index.get(kmer, ()))
+    return sorted(candidates)
+
+def getCandidatePairs(rowFragments, columnFragments, seedLength=SEED_LENGTH,
+                      window=None):
+    '''
+    @return List of lists Entry i holds the indices j of the column fragments
+            for which overlap(rowFragments[i], columnFragments[j]) should be
+            computed
+    '''
+    index = buildSeedIndex(columnFragments, seedLength, window)
+    return [getCandidateColumns(f, index, seedLength, window) for f in rowFragments]
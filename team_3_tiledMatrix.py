@@ -0,0 +1,301 @@
+'''
+Builds the pairwise overlap and offset matrices in fixed-size tiles which are
+written to disk as they finish, so that a run which dies part of the way through
+a big all-pairs computation can pick up where it left off.
+
+Each call to getTiledPairwiseMatrices() is a job with its own directory under
+the tile directory, named after a hash of the fragments and the settings the
+overlaps depend on, so rerunning the same computation finds its earlier tiles.
+A job directory holds:
+  - manifest.json: the description of the job (the fragments' hashes, the
+    matrix shape, the tile size and the overlap() settings)
+  - completedTiles.txt: one line per finished tile, appended as each finishes
+  - overlap_<row>_<column>.npy and offsets_<row>_<column>.npy: the tiles
+A tile's files are written before it is logged as complete, so a tile cut off
+part of the way through is simply computed again. Tiles are also the unit of
+work handed to the worker processes.
+
+Once every tile is done, the tiles are assembled into overlap.npy and offsets.npy
+in the job directory one band of rows at a time, and deleted. The assembled
+matrices are memory-mapped rather than read into memory. A finished job is only
+needed until the caller has written its own outputs, after which
+removeFinishedJobs() deletes it; an unfinished one is kept to be resumed.
+
+Written for Python 3
+'''
+
+import hashlib
+import json
+import os
+import shutil
+
+import concurrent.futures
+
+import team_3_scoreAlignments as scoring
+from team_3_matrixIO import writeMatrix, writeMatrixRows, loadMatrix
+
+# The number of rows and columns in each tile
+TILE_SIZE = 256
+
+MANIFEST_FILE = "manifest.json"
+COMPLETED_TILES_FILE = "completedTiles.txt"
+
+# Bump this if the on-disk format changes
+TILE_FORMAT = 1
+
+# The two matrices each tile holds a piece of
+MATRIX_KINDS = ("overlap", "offsets")
+
+def getFragmentsDigest(fragments):
+    '''
+    @return String A hash identifying the list of fragments, in order
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    for f in fragments:
+        digest.update(f.encode("ascii"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def getJobDescription(rowFragments, columnFragments, engine, seedLength, tileSize):
+    '''
+    @return Dictionary Everything the contents of the tiles depend on
+    '''
+    return { "format": TILE_FORMAT,
+             "rows": getFragmentsDigest(rowFragments),
+             "columns": getFragmentsDigest(columnFragments),
+             "numRows": len(rowFragments),
+             "numColumns": len(columnFragments),
+             "tileSize": tileSize,
+             "settings": scoring.getOverlapCacheTag(engine),
+             "seedLength": seedLength,
+             "seedWindow": scoring.SEED_FILTER_WINDOW if seedLength is not None
+                           else None }
+
+def getJobDirectory(tileDirectory, description):
+    key = json.dumps(description, sort_keys=True).encode("ascii")
+    return os.path.join(tileDirectory, hashlib.blake2b(key, digest_size=8).hexdigest())
+
+def getTiles(numRows, numColumns, tileSize):
+    '''
+    @return List of tuples (first row, last row, first column, last column) of
+            each tile, in row-major order; the last rows and columns are
+            exclusive
+    '''
+    return [ (first, min(first + tileSize, numRows), firstCol,
+              min(firstCol + tileSize, numColumns))
+             for first in range(0, numRows, tileSize)
+             for firstCol in range(0, numColumns, tileSize) ]
+
+def getTileFile(jobDirectory, kind, first, firstCol):
+    return os.path.join(jobDirectory, "%s_%d_%d.npy" % (kind, first, firstCol))
+
+def loadManifest(jobDirectory, description):
+    '''
+    @return Set of tuples The (first row, first column) of each tile already
+            computed, or None if the directory holds a different job (or none)
+    '''
+    try:
+        with open(os.path.join(jobDirectory, MANIFEST_FILE)) as infile:
+            manifest = json.load(infile)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("job") != description:
+        return None
+
+    completed = set()
+    try:
+        with open(os.path.join(jobDirectory, COMPLETED_TILES_FILE)) as infile:
+            for line in infile:
+                values = line.split()
+                # A line cut off part of the way through doesn't count
+                if len(values) == 2 and line.endswith("\n"):
+                    completed.add((int(values[0]), int(values[1])))
+    except OSError:
+        pass
+    return completed
+
+def writeManifest(jobDirectory, description, assembled=False):
+    temporaryFile = os.path.join(jobDirectory, MANIFEST_FILE + ".tmp")
+    with open(temporaryFile, "w") as outfile:
+        json.dump({ "job": description, "assembled": assembled }, outfile, indent=2)
+    os.replace(temporaryFile, os.path.join(jobDirectory, MANIFEST_FILE))
+
+def isAssembled(jobDirectory):
+    with open(os.path.join(jobDirectory, MANIFEST_FILE)) as infile:
+        return json.load(infile).get("assembled", False)
+
+def computeTile(rowFragments, columns, first, last, firstCol, lastCol, engine,
+                candidates=None):
+    '''
+    @param columns The column fragments, as returned by
+                   team_3_scoreAlignments.prepareColumns()
+    @param candidates List of lists If given, only the columns in candidates[i]
+                                    are compared against rowFragments[i]
+    @return Tuple (first row, first column, the tile of the overlap matrix, the
+                   tile of the offset matrix)
+    '''
+    tileColumns = range(firstCol, lastCol)
+    overlapRows = []
+    offsetRows = []
+    for i in range(first, last):
+        if candidates is None:
+            overlapRow, offsetRow = scoring.computeCandidateOverlaps(
+                rowFragments[i], columns, tileColumns, engine)
+        else:
+            overlapRow = [0] * len(tileColumns)
+            offsetRow = [len(rowFragments[i])] * len(tileColumns)
+            rowCandidates = [j for j in candidates[i] if firstCol <= j < lastCol]
+            scores, offsets = scoring.computeCandidateOverlaps(
+                rowFragments[i], columns, rowCandidates, engine)
+            for j, score, offset in zip(rowCandidates, scores, offsets):
+                overlapRow[j - firstCol] = score
+                offsetRow[j - firstCol] = offset
+        overlapRows.append(overlapRow)
+        offsetRows.append(offsetRow)
+    return first, firstCol, overlapRows, offsetRows
+
+def computeTileInWorker(first, last, firstCol, lastCol):
+    ''' Run in a process set up by team_3_scoreAlignments.initMatrixWorker() '''
+    return computeTile(scoring._workerRowFragments, scoring._workerColumns, first, last,
+                       firstCol, lastCol, scoring._workerEngine,
+                       scoring._workerCandidates)
+
+def saveTile(jobDirectory, completedFile, first, firstCol, overlapRows, offsetRows):
+    for kind, rows in zip(MATRIX_KINDS, (overlapRows, offsetRows)):
+        tileFile = getTileFile(jobDirectory, kind, first, firstCol)
+        writeMatrix(tileFile + ".tmp", rows)
+        os.replace(tileFile + ".tmp", tileFile)
+    completedFile.write("%d %d\n" % (first, firstCol))
+    completedFile.flush()
+
+def computeTiles(rowFragments, columnFragments, jobDirectory, tiles, engine, workers,
+                 candidates=None):
+    '''
+    Computes the given tiles, saving each one as soon as it's done.
+    '''
+    completedFile = open(os.path.join(jobDirectory, COMPLETED_TILES_FILE), "a")
+    try:
+        if workers <= 1 or len(tiles) < 2:
+            columns = scoring.prepareColumns(columnFragments, engine)
+            for first, last, firstCol, lastCol in tiles:
+                saveTile(jobDirectory, completedFile,
+                         *computeTile(rowFragments, columns, first, last, firstCol,
+                                      lastCol, engine, candidates))
+            return
+
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=scoring.initMatrixWorker,
+                initargs=(rowFragments, columnFragments, engine,
+                          scoring.ALLOWED_ERROR_RATE, candidates,
+                          scoring.INDEL_ERROR_RATE,
+                          scoring.MIN_OVERLAP_LENGTH)) as pool:
+            futures = [pool.submit(computeTileInWorker, *tile) for tile in tiles]
+            for future in concurrent.futures.as_completed(futures):
+                saveTile(jobDirectory, completedFile, *future.result())
+    finally:
+        completedFile.close()
+
+def iterAssembledRows(jobDirectory, kind, numRows, numColumns, tileSize):
+    '''
+    @return Generator of the rows of the whole matrix, loading one band of tiles
+            at a time
+    '''
+    for first in range(0, numRows, tileSize):
+        band = [ loadMatrix(getTileFile(jobDirectory, kind, first, firstCol))
+                 for firstCol in range(0, numColumns, tileSize) ]
+        for i in range(min(tileSize, numRows - first)):
+            row = []
+            for tile in band:
+                row.extend(tile[i])
+            yield row
+
+def assembleMatrices(jobDirectory, description):
+    '''
+    Writes overlap.npy and offsets.npy in the job directory from the tiles, then
+    deletes the tiles.
+    '''
+    numRows = description["numRows"]
+    numColumns = description["numColumns"]
+    tileSize = description["tileSize"]
+    for kind in MATRIX_KINDS:
+        matrixFile = os.path.join(jobDirectory, kind + ".npy")
+        writeMatrixRows(matrixFile + ".tmp",
+                        iterAssembledRows(jobDirectory, kind, numRows, numColumns,
+                                          tileSize),
+                        numRows, numColumns)
+        os.replace(matrixFile + ".tmp", matrixFile)
+    writeManifest(jobDirectory, description, assembled=True)
+
+    for first, last, firstCol, lastCol in getTiles(numRows, numColumns, tileSize):
+        for kind in MATRIX_KINDS:
+            os.remove(getTileFile(jobDirectory, kind, first, firstCol))
+    os.remove(os.path.join(jobDirectory, COMPLETED_TILES_FILE))
+
+def removeFinishedJobs(tileDirectory):
+    '''
+    Deletes the directory of every assembled job under the tile directory. Call
+    it once whatever is needed from the matrices has been written elsewhere.
+    Jobs still waiting on tiles are left to be resumed.
+
+    @return Integer The number of jobs deleted
+    '''
+    numRemoved = 0
+    if not os.path.isdir(tileDirectory):
+        return numRemoved
+    for name in os.listdir(tileDirectory):
+        jobDirectory = os.path.join(tileDirectory, name)
+        try:
+            if not isAssembled(jobDirectory):
+                continue
+        except (OSError, ValueError):
+            continue
+        shutil.rmtree(jobDirectory)
+        numRemoved += 1
+    return numRemoved
+
+def getTiledPairwiseMatrices(rowFragments, columnFragments, tileDirectory, engine=None,
+                             workers=None, seedLength=None, tileSize=TILE_SIZE):
+    '''
+    Like team_3_scoreAlignments.getPairwiseMatrices(), but builds the matrices in
+    tiles checkpointed under the tile directory, skipping any tiles an earlier
+    run of the same job already finished.
+
+    @param tileDirectory String The directory to keep each job's tiles in
+    @return Tuple (overlap matrix, offset matrix), memory-mapped copy-on-write
+            from the assembled .npy files
+    '''
+    if engine is None:
+        engine = scoring.OVERLAP_ENGINE
+    if workers is None:
+        workers = scoring.NUM_WORKERS
+    if seedLength is None:
+        seedLength = scoring.SEED_FILTER_LENGTH
+
+    description = getJobDescription(rowFragments, columnFragments, engine, seedLength,
+                                     tileSize)
+    jobDirectory = getJobDirectory(tileDirectory, description)
+    completed = loadManifest(jobDirectory, description)
+    if completed is None:
+        os.makedirs(jobDirectory, exist_ok=True)
+        # Whatever was logged here belonged to a different job
+        open(os.path.join(jobDirectory, COMPLETED_TILES_FILE), "w").close()
+        writeManifest(jobDirectory, description)
+        completed = set()
+
+    if not isAssembled(jobDirectory):
+        tiles = [ tile for tile in getTiles(len(rowFragments), len(columnFragments),
+                                            tileSize)
+                  if (tile[0], tile[2]) not in completed ]
+        if len(completed) > 0:
+            print("Resuming from", len(completed), "finished tiles;", len(tiles),
+                  "left to compute.")
+        candidates = None
+        if seedLength is not None:
+            candidates = scoring.getSeedCandidates(rowFragments, columnFragments,
+                                                   seedLength)
+        computeTiles(rowFragments, columnFragments, jobDirectory, tiles, engine,
+                     workers, candidates)
+        assembleMatrices(jobDirectory, description)
+
+    return tuple(loadMatrix(os.path.join(jobDirectory, kind + ".npy"), copyOnWrite=True)
+                 for kind in MATRIX_KINDS)
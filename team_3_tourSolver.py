@@ -0,0 +1,425 @@
+"""
+Finds a good order in which to lay out the fragments, working directly on the
+overlap and offset matrices written by team_3_scoreAlignments.py.
+
+The score of an order (a "tour") is the same one team_3_tsp.getAlignmentScore()
+uses: the length of the layout, i.e. the sum of the offsets between neighboring
+fragments plus the length of the last fragment. Lower is better.
+
+The search starts from a greedy tour (joining the pairs with the largest overlaps
+first) and improves it with 2-opt (reversing a stretch of the tour) and Or-opt
+(moving a short stretch elsewhere) moves until no move helps or the time budget
+runs out. Only the fragments next to a change are looked at again. Every move
+is scored in O(log N) time: the tour is stored between two virtual end points,
+along with running totals (Fenwick trees) of the cost of walking it forwards and
+backwards, so that a reversed stretch costs a subtraction, and a move only
+updates the totals over the stretch it changed.
+
+Written for Python 3
+"""
+
+import collections
+import heapq
+import time
+
+import team_3_instrumentation as instrumentation
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# How many of the best successors and predecessors of each fragment to consider
+# when looking for moves
+NUM_NEIGHBORS = 10
+
+# The longest stretch of the tour an Or-opt move will pick up
+MAX_SEGMENT_LENGTH = 3
+
+# The default time budget for the local search, in seconds
+TIME_BUDGET = 60.0
+
+# How many random double-bridge kicks perturbTour() applies to a starting tour
+NUM_KICKS = 3
+
+def getTourScore(offsetMatrix, lengths, tour):
+    """
+    @return Integer The length of the layout of the fragments in the order given
+    """
+    if len(tour) == 0:
+        return 0
+    score = 0
+    for k in range(len(tour) - 1):
+        score += offsetMatrix[tour[k]][tour[k + 1]]
+    return int(score + lengths[tour[-1]])
+
+def evaluateTours(tours, offsetMatrix, lengths):
+    """
+    Scores a whole population of tours at once.
+
+    @param tours 2-D array-like of integers One tour per row (all the same length)
+    @param offsetMatrix Matrix The pairwise offsets (ideally a NumPy array)
+    @param lengths Array-like of integers The length of each fragment
+    @return NumPy array (or list, without NumPy) The score of each tour, as
+            getTourScore() would calculate it
+    """
+    if instrumentation.ENABLED:
+        instrumentation.count("tours.scored", len(tours))
+    if numpy is None:
+        return [getTourScore(offsetMatrix, lengths, tour) for tour in tours]
+
+    tours = numpy.asarray(tours, dtype=numpy.intp)
+    if tours.ndim != 2 or tours.shape[1] == 0:
+        return numpy.zeros(len(tours), dtype=numpy.int64)
+    offsetMatrix = numpy.asarray(offsetMatrix)
+    lengths = numpy.asarray(lengths, dtype=numpy.int64)
+    return offsetMatrix[tours[:, :-1], tours[:, 1:]].sum(axis=1, dtype=numpy.int64) \
+           + lengths[tours[:, -1]]
+
+def getGreedyTour(overlapMatrix):
+    """
+    Joins fragments pairwise, largest overlap first, as long as each fragment has
+    at most one successor and one predecessor and no cycle forms. The resulting
+    chains are then laid end to end.
+
+    @return List of integers The tour
+    """
+    numSeqs = len(overlapMatrix)
+    if numpy is not None and hasattr(overlapMatrix, "shape"):
+        # Only pull the overlapping pairs out of a (possibly memory-mapped) array
+        rows, columns = numpy.nonzero(overlapMatrix > 0)
+        keep = rows != columns
+        rows = rows[keep]
+        columns = columns[keep]
+        edges = list(zip(overlapMatrix[rows, columns].tolist(), rows.tolist(),
+                         columns.tolist()))
+    else:
+        edges = [ (overlapMatrix[i][j], i, j) for i in range(numSeqs)
+                  for j in range(numSeqs) if i != j and overlapMatrix[i][j] > 0 ]
+    return getGreedyTourFromEdges(numSeqs, edges)
+
+def getGreedyTourFromEdges(numSeqs, edges):
+    """
+    Like getGreedyTour(), but only considers the given edges (e.g. those of a
+    sparse overlap graph).
+
+    @param edges List of tuples (overlap length, i, j) for each pair of
+                 fragments i, j which overlap
+    @return List of integers The tour
+    """
+    edges = sorted((-theOverlap, i, j) for theOverlap, i, j in edges)
+
+    successor = [-1] * numSeqs
+    predecessor = [-1] * numSeqs
+    # The chain each fragment is in, as a union-find forest
+    chain = list(range(numSeqs))
+
+    def findChain(i):
+        while chain[i] != i:
+            chain[i] = chain[chain[i]]
+            i = chain[i]
+        return i
+
+    for negativeOverlap, i, j in edges:
+        if successor[i] != -1 or predecessor[j] != -1:
+            continue
+        chainOfI = findChain(i)
+        chainOfJ = findChain(j)
+        if chainOfI == chainOfJ:
+            continue
+        successor[i] = j
+        predecessor[j] = i
+        chain[chainOfJ] = chainOfI
+
+    tour = []
+    for i in range(numSeqs):
+        if predecessor[i] == -1:
+            while i != -1:
+                tour.append(i)
+                i = successor[i]
+    return tour
+
+def perturbTour(tour, rng, numKicks=NUM_KICKS):
+    """
+    Applies random double-bridge kicks (splitting the tour into A B C D and
+    putting it back together as A C B D), which the local search can't undo in
+    a single move, so that restarts explore different parts of the search space.
+
+    @param rng random.Random The random number generator to use
+    @return List of integers The perturbed tour
+    """
+    tour = list(tour)
+    if len(tour) < 4:
+        return tour
+    for kick in range(numKicks):
+        first, second, third = sorted(rng.sample(range(1, len(tour)), 3))
+        tour = tour[:first] + tour[second:third] + tour[first:second] + tour[third:]
+    return tour
+
+def getNeighborLists(offsetMatrix, numNeighbors):
+    """
+    @return Tuple (best successors, best predecessors): for each fragment, the
+            fragments which can follow (or precede) it with the smallest offset
+    """
+    numSeqs = len(offsetMatrix)
+    successors = []
+    predecessors = []
+    if numpy is not None and hasattr(offsetMatrix, "shape"):
+        for a in range(numSeqs):
+            successors.append(getNearest(offsetMatrix[a], a, numNeighbors))
+            predecessors.append(getNearest(offsetMatrix[:, a], a, numNeighbors))
+        return successors, predecessors
+
+    for a in range(numSeqs):
+        row = offsetMatrix[a]
+        successors.append(heapq.nsmallest(numNeighbors,
+                                          (b for b in range(numSeqs) if b != a),
+                                          key=lambda b: row[b]))
+        predecessors.append(heapq.nsmallest(numNeighbors,
+                                            (b for b in range(numSeqs) if b != a),
+                                            key=lambda b: offsetMatrix[b][a]))
+    return successors, predecessors
+
+def getNearest(offsets, a, numNeighbors):
+    """
+    @param offsets NumPy array The offsets from (or to) fragment a
+    @return List of integers The numNeighbors fragments other than a with the
+            smallest offsets, ties going to the lower index as in
+            heapq.nsmallest()
+    """
+    order = numpy.argsort(offsets, kind="stable")
+    return order[order != a][:numNeighbors].tolist()
+
+def prepareTourSearch(overlapMatrix, offsetMatrix, numNeighbors=NUM_NEIGHBORS):
+    """
+    Does the part of solveTour() which is the same for every search of the same
+    matrices, so that restarts can share it rather than each redoing it.
+
+    @return Tuple (greedy tour, neighbor lists) to pass to solveTour()
+    """
+    numNeighbors = min(numNeighbors, max(len(offsetMatrix) - 1, 0))
+    return getGreedyTour(overlapMatrix), getNeighborLists(offsetMatrix, numNeighbors)
+
+class PrefixSums:
+    """
+    Running totals of a list of numbers (a Fenwick tree), so that changing one
+    of them and adding up a stretch of them both take O(log n) steps
+    """
+
+    def __init__(self, values):
+        self.tree = [0] + list(values)
+        for k in range(1, len(self.tree)):
+            parent = k + (k & -k)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[k]
+
+    def add(self, index, delta):
+        """ Adds delta to values[index] """
+        k = index + 1
+        while k < len(self.tree):
+            self.tree[k] += delta
+            k += k & -k
+
+    def getTotal(self, index):
+        """ @return The sum of values[0..index] """
+        k = index + 1
+        total = 0
+        while k > 0:
+            total += self.tree[k]
+            k -= k & -k
+        return total
+
+@instrumentation.timed("improve tour")
+def improveTour(tour, offsetMatrix, lengths, timeBudget=TIME_BUDGET,
+                numNeighbors=NUM_NEIGHBORS, neighborLists=None):
+    """
+    Improves the tour with 2-opt and Or-opt moves until none helps or the time
+    budget runs out.
+
+    Fragments wait in a queue to be looked at (every one, to begin with). The
+    best move starting at a fragment is made if it helps, and the fragments at
+    either end of each edge it changed go back into the queue; a fragment with
+    no helpful move stays out of it until a neighboring move puts it back. A
+    move only rewrites the stretch of the tour it changes, along with the
+    running totals over that stretch.
+
+    @param tour List of integers The starting tour
+    @param offsetMatrix Matrix The pairwise offsets: a list of lists or a NumPy
+                        array, which is read in place (it may be memory-mapped)
+    @param lengths List of integers The length of each fragment
+    @param neighborLists Tuple (best successors, best predecessors) of each
+                         fragment, as returned by getNeighborLists(); by default
+                         they're found by scanning the whole offset matrix
+    @return List of integers The improved tour
+    """
+    numSeqs = len(tour)
+    if numSeqs < 3:
+        return list(tour)
+    deadline = None if timeBudget is None else time.time() + timeBudget
+
+    # The tour is stored between two virtual fragments: leaving START costs
+    # nothing, and arriving at END costs the length of the last real fragment
+    START = numSeqs
+    END = numSeqs + 1
+
+    if hasattr(offsetMatrix, "item"):
+        # Read single entries of an array as Python integers
+        getOffset = offsetMatrix.item
+    else:
+        getOffset = lambda a, b: offsetMatrix[a][b]
+
+    def cost(a, b):
+        if a == START:
+            return 0
+        if b == END:
+            return lengths[a]
+        return getOffset(a, b)
+
+    if neighborLists is None:
+        neighborLists = getNeighborLists(offsetMatrix, min(numNeighbors, numSeqs - 1))
+    successors, predecessors = neighborLists
+
+    path = [START] + list(tour) + [END]
+    position = [0] * (numSeqs + 2)
+    for k, node in enumerate(path):
+        position[node] = k
+
+    def getEdgeCosts(k):
+        """ @return Tuple The cost of the edge into path[k] forwards and backwards """
+        if path[k - 1] != START and path[k] != END:
+            return cost(path[k - 1], path[k]), cost(path[k], path[k - 1])
+        return cost(path[k - 1], path[k]), 0
+
+    # forward.getTotal(k) (backward.getTotal(k)) is the cost of walking
+    # path[0..k] forwards (backwards)
+    forwardCosts = [0] * len(path)
+    backwardCosts = [0] * len(path)
+    for k in range(1, len(path)):
+        forwardCosts[k], backwardCosts[k] = getEdgeCosts(k)
+    forward = PrefixSums(forwardCosts)
+    backward = PrefixSums(backwardCosts)
+
+    def replaceStretch(first, nodes):
+        """
+        Writes the nodes over path[first:first + len(nodes)], and updates their
+        positions and the costs of the edges into, within and out of them
+        """
+        path[first:first + len(nodes)] = nodes
+        for k in range(first, first + len(nodes)):
+            position[path[k]] = k
+        for k in range(first, first + len(nodes) + 1):
+            forwardCost, backwardCost = getEdgeCosts(k)
+            forward.add(k, forwardCost - forwardCosts[k])
+            backward.add(k, backwardCost - backwardCosts[k])
+            forwardCosts[k] = forwardCost
+            backwardCosts[k] = backwardCost
+
+    queue = collections.deque(tour)
+    queued = [True] * numSeqs + [False, False]
+
+    def wake(node):
+        if not queued[node] and node != START and node != END:
+            queued[node] = True
+            queue.append(node)
+
+    while len(queue) > 0:
+        if deadline is not None and time.time() > deadline:
+            break
+        node = queue.popleft()
+        queued[node] = False
+        i = position[node]
+        before = path[i - 1]
+
+        bestDelta = 0
+        bestMove = None
+
+        # 2-opt: reverse path[i..j], either so that path[j] follows one of
+        # path[i-1]'s best successors or so that path[i] precedes one of its own
+        # best successors
+        candidates = set(position[s] - 1 for s in successors[node])
+        if before != START:
+            candidates.update(position[s] for s in successors[before])
+        for j in candidates:
+            if j <= i or j > numSeqs:
+                continue
+            after = path[j + 1]
+            delta = cost(before, path[j]) + cost(node, after) \
+                    - cost(before, node) - cost(path[j], after) \
+                    + (backward.getTotal(j) - backward.getTotal(i)) \
+                    - (forward.getTotal(j) - forward.getTotal(i))
+            if delta < bestDelta:
+                bestDelta = delta
+                bestMove = ("reverse", i, j)
+
+        # Or-opt: move path[i..i+length-1] to just after one of its first
+        # fragment's best predecessors (or to the start of the tour)
+        for length in range(1, MAX_SEGMENT_LENGTH + 1):
+            last = i + length - 1
+            if last > numSeqs:
+                break
+            after = path[last + 1]
+            removalDelta = cost(before, after) - cost(before, node) \
+                           - cost(path[last], after)
+            for candidate in predecessors[node] + [START]:
+                k = position[candidate]
+                if i - 1 <= k <= last:
+                    continue
+                delta = removalDelta + cost(path[k], node) \
+                        + cost(path[last], path[k + 1]) - cost(path[k], path[k + 1])
+                if delta < bestDelta:
+                    bestDelta = delta
+                    bestMove = ("move", i, last, k)
+
+        if bestMove is None:
+            continue
+        if instrumentation.ENABLED:
+            instrumentation.count("tourSolver.moves")
+        if bestMove[0] == "reverse":
+            i, j = bestMove[1], bestMove[2]
+            changed = (path[i - 1], path[i], path[j], path[j + 1])
+            replaceStretch(i, path[i:j + 1][::-1])
+        else:
+            i, last, k = bestMove[1], bestMove[2], bestMove[3]
+            changed = (path[i - 1], path[i], path[last], path[last + 1], path[k],
+                       path[k + 1])
+            segment = path[i:last + 1]
+            if k < i:
+                replaceStretch(k + 1, segment + path[k + 1:i])
+            else:
+                replaceStretch(i, path[last + 1:k + 1] + segment)
+        for changedNode in changed:
+            wake(changedNode)
+
+    return path[1:-1]
+
+def solveTour(overlapMatrix, offsetMatrix, lengths, timeBudget=TIME_BUDGET,
+              numNeighbors=NUM_NEIGHBORS, startTours=None, rng=None, prepared=None):
+    """
+    @param overlapMatrix Matrix The pairwise overlap lengths
+    @param offsetMatrix Matrix The pairwise offsets
+    @param lengths List of integers The length of each fragment
+    @param timeBudget Float Seconds to spend improving the tour (None: no limit)
+    @param startTours List of tours Other tours to consider starting from; the
+                                    best of these and the greedy tour (scored
+                                    together with evaluateTours()) is improved
+    @param rng random.Random If given, the starting tour is perturbed with
+                             perturbTour() first (for independent restarts)
+    @param prepared Tuple The greedy tour and neighbor lists, as returned by
+                          prepareTourSearch() (found here if not given)
+    @return Tuple (score, tour)
+    """
+    if prepared is None:
+        prepared = prepareTourSearch(overlapMatrix, offsetMatrix, numNeighbors)
+    greedyTour, neighborLists = prepared
+
+    tours = [list(greedyTour)]
+    if startTours is not None:
+        tours.extend(list(t) for t in startTours)
+    scores = evaluateTours(tours, offsetMatrix, lengths)
+    tour = tours[min(range(len(tours)), key=lambda k: scores[k])]
+    if rng is not None:
+        tour = perturbTour(tour, rng)
+
+    tour = improveTour(tour, offsetMatrix, lengths, timeBudget, numNeighbors,
+                       neighborLists)
+    return getTourScore(offsetMatrix, lengths, tour), tour
@@ -6,9 +6,12 @@ the maximum Traveling Salesperson Problem on them. Outputs a file called
 Relies on files output by team_3_scoreAlignments.py. First run that program, then
 run this one in the same directory.
 
+By default the order is found by the local search in team_3_tourSolver.py. Set
+TOUR_SOLVER to "ga" to use the original genetic algorithm instead, which needs
+pyevolve.
+
 Tyler Young
-Written for Python 2 (as pyevolve has not been updated
-    for compatibility with Python3)
+Written for Python 3
 """
 
 
@@ -24,20 +27,49 @@ Written for Python 2 (as pyevolve has not been updated
 # - tour_length
 # - write_tour_to_img
 
-from pyevolve import G1DList
-from pyevolve import GSimpleGA
-from pyevolve import GAllele
-from pyevolve import Mutators
-from pyevolve import Initializators
-from pyevolve import DBAdapters
-from pyevolve import Crossovers
-from pyevolve import Consts
-import datetime, random
-from math import sqrt
-from team_3_scoreAlignments import overlap
+try:
+    from pyevolve import G1DList
+    from pyevolve import GSimpleGA
+    from pyevolve import GAllele
+    from pyevolve import Mutators
+    from pyevolve import Initializators
+    from pyevolve import DBAdapters
+    from pyevolve import Crossovers
+    from pyevolve import Consts
+    from pyevolve import GPopulation
+    PYEVOLVE_SUPPORT = True
+except ImportError:
+    PYEVOLVE_SUPPORT = False
+import concurrent.futures, os, random, time
+from team_3_matrixIO import findMatrixFile, loadMatrix
+from team_3_fragmentStore import FRAGMENT_STORE_FILE, readFragments
+import team_3_tourSolver
+import team_3_instrumentation as instrumentation
 
 PIL_SUPPORT = False
 
+# Which ordering engine main_run() uses: "local" for the greedy start plus local
+# search in team_3_tourSolver.py, or "ga" for pyevolve's genetic algorithm
+TOUR_SOLVER = "local"
+
+# The most time, in seconds, the local search may take in each restart
+TIME_BUDGET = team_3_tourSolver.TIME_BUDGET
+
+# How many independent, seeded searches to run. Each restart of the genetic
+# algorithm draws its own crossover rate, mutation rate and population size; each
+# restart of the local search after the first starts from a perturbed tour.
+NUM_RESTARTS = 16
+
+# How many processes to run the restarts on (no more than RESTART_PATIENCE are
+# used)
+RESTART_WORKERS = os.cpu_count() or 1
+
+# Stop early once this many restarts in a row have failed to beat the best score
+RESTART_PATIENCE = 4
+
+# The table every restart's parameters and score are appended to
+RESULTS_TABLE_FILE = "tourRestarts.tsv"
+
 def read_coords(coord_file):
     """ Read the coords from file """
     coords=[]
@@ -63,47 +95,49 @@ def readFragmentFile(fragmentFile):
             fragments.append(line)
     return fragments
 
-memo = {}
 def getAlignmentScore(matrix, tour):
     """ Returns the total score for this solution """
-    global fragments, memo
-
-    alignmentList = []
-    for i in range( len(tour)-1 ):
-        alignmentList.append( ( int(tour[i]), int(tour[i+1])) )
-
-    offset = 0
-    for pair in alignmentList:
-        if pair[0] == pair[1] == 0:
-            print("Error, error, error!")
-            break
-        if pair in memo:
-            offset += memo[pair]
-        else:
-            theOverlap, addToOffset = overlap(fragments[pair[0]], fragments[pair[1]])
-            offset += addToOffset
-            memo[pair] = addToOffset
-
-    # Return the length of the overall alignment
-    # Offset tells us where the last thing lines up against the whole sequence
-    # The full length of the aligned fragments is the offset plus the length of
-    # the last fragment
-    return offset + len(fragments[ tour[-1] ])
+    global offsets, fragmentLengths
+    if instrumentation.ENABLED:
+        instrumentation.count("tsp.alignmentScoreCalls")
+
+    # The length of the overall alignment: the sum of the offsets tells us where
+    # the last thing lines up against the whole sequence, and the full length of
+    # the aligned fragments is that plus the length of the last fragment
+    return int(team_3_tourSolver.evaluateTours([list(tour)], offsets, fragmentLengths)[0])
+
+def evaluatePopulation(population, **args):
+    """
+    Replaces pyevolve's GPopulation.evaluate(), which calls eval_func() once per
+    individual, with a single batched evaluation of the whole population
+    """
+    global offsets, fragmentLengths
+
+    # pyevolve evaluates the population once per generation
+    with instrumentation.stage("GA generation"):
+        tours = [individual.getInternalList() for individual in population.internalPop]
+        scores = team_3_tourSolver.evaluateTours(tours, offsets, fragmentLengths)
+        for individual, score in zip(population.internalPop, scores):
+            individual.score = float(score)
+        population.clearFlags()
 
 def G1DListTSPInitializator(genome, **args):
    """ The initializator for the TSP """
    genome.clearList()
    # Note: getListSize() used to be just a field called listSize
-   lst = [i for i in xrange(genome.getListSize())]
+   lst = [i for i in range(genome.getListSize())]
 
-   for i in xrange(genome.getListSize()):
+   for i in range(genome.getListSize()):
       choice = random.choice(lst)
       lst.remove(choice)
       genome.append(choice)
 
 cm = []
 coords = []
+offsets = []
 fragments = []
+fragmentLengths = []
+preparedSearch = None
 
 def eval_func(chromosome):
    """ The evaluation function """
@@ -112,25 +146,80 @@ def eval_func(chromosome):
    return getAlignmentScore(cm, chromosome)
 
 
-def main_run(distancesFileName, fragmentFileName, crossover_rate=1.0, mutation_rate=0.03, population_size=80):
+def main_run(distancesFileName, fragmentFileName, crossover_rate=1.0, mutation_rate=0.03, population_size=80, offsetsFileName="offsets.npy", solver=None):
     """
     @param distancesFileName String The file containing the pairwise distances of all
-                                fragments
+                                fragments (.npy, or the legacy text format)
+    @param fragmentFileName String The fragment store, or a file with one fragment
+                                   per line
+    @param offsetsFileName String The file containing the offset at which each
+                                  pairwise overlap starts (.npy, or the legacy
+                                  text format)
+    @param solver String "local" or "ga" (default: TOUR_SOLVER). The crossover
+                         rate, mutation rate and population size only matter to
+                         the genetic algorithm.
+    @return Tuple (score, best order of the fragments)
     """
-    global cm, coords, fragments
+    loadInputs(distancesFileName, fragmentFileName, offsetsFileName)
+    return solve(crossover_rate, mutation_rate, population_size, solver)
+
+@instrumentation.timed("load inputs")
+def loadInputs(distancesFileName, fragmentFileName, offsetsFileName):
+    """ Loads the matrices and fragments that solve() works on """
+    global cm, coords, offsets, fragments, fragmentLengths, preparedSearch
 
     # Load the fragments
-    fragmentFile = open(fragmentFileName, "r")
-    fragments = readFragmentFile(fragmentFile)
+    fragments = readFragments(fragmentFileName)
+    fragmentLengths = [len(f) for f in fragments]
 
-    # load the tsp data file
-    filehandle = open(distancesFileName, "r")
-    coords = read_coords(filehandle)
+    # load the tsp data file (memory-mapped, unless it's in the old text format)
+    coords = loadMatrix(distancesFileName)
     cm = coords
 
+    # load the offsets computed alongside the overlaps; a text matrix is made
+    # dense so that whole populations can be scored at once
+    offsets = loadMatrix(offsetsFileName)
+    if isinstance(offsets, list) and team_3_tourSolver.numpy is not None:
+        offsets = team_3_tourSolver.numpy.array(offsets)
+
+    # Found by the first local search (or handed to the restart workers)
+    preparedSearch = None
+
+def getPreparedSearch():
+    """
+    @return Tuple The greedy tour and neighbor lists of the loaded inputs, as
+            returned by team_3_tourSolver.prepareTourSearch()
+    """
+    global preparedSearch
+    if preparedSearch is None:
+        preparedSearch = team_3_tourSolver.prepareTourSearch(coords, offsets)
+    return preparedSearch
+
+@instrumentation.timed("tour search")
+def solve(crossover_rate=1.0, mutation_rate=0.03, population_size=80, solver=None, seed=None):
+    """
+    Runs one search over the inputs loaded by loadInputs().
+
+    @param seed Integer If given, seeds the search's random number generator
+    @return Tuple (score, best order of the fragments)
+    """
+    if solver is None:
+        solver = TOUR_SOLVER
+
+    if solver == "local":
+        # With a seed, start from a perturbed tour so that restarts differ
+        rng = None if seed is None else random.Random(seed)
+        return team_3_tourSolver.solveTour(coords, offsets, fragmentLengths,
+                                           TIME_BUDGET, rng=rng,
+                                           prepared=getPreparedSearch())
+    elif solver != "ga":
+        raise ValueError("Unknown tour solver: " + str(solver))
+    elif not PYEVOLVE_SUPPORT:
+        raise ImportError("The genetic algorithm requires pyevolve")
+
     # set the alleles to the cities numbers
     setOfAlleles = GAllele.GAlleles(homogeneous=True)
-    lst = [ i for i in xrange(len(coords)) ]
+    lst = [ i for i in range(len(coords)) ]
     a = GAllele.GAlleleList(lst)
     setOfAlleles.add(a)
 
@@ -142,6 +231,11 @@ def main_run(distancesFileName, fragmentFileName, crossover_rate=1.0, mutation_r
     genome.crossover.set(Crossovers.G1DListCrossoverOX)
     genome.initializator.set(G1DListTSPInitializator)
 
+    # Score each generation in one batch rather than an individual at a time
+    GPopulation.GPopulation.evaluate = evaluatePopulation
+
+    if seed is not None:
+        random.seed(seed)
     ga = GSimpleGA.GSimpleGA(genome)
     ga.setGenerations(5000) # 10000 is a good "real" value
     ga.setMinimax(Consts.minimaxType["minimize"])
@@ -154,58 +248,161 @@ def main_run(distancesFileName, fragmentFileName, crossover_rate=1.0, mutation_r
 
     return eval_func(best), best.getInternalList()
 
+def getRestartParameters(seed, solver):
+    """
+    @return Dictionary The parameters of the restart with this seed (the GA's are
+            drawn at random from the seed)
+    """
+    parameters = { "seed": seed, "solver": solver, "crossover": None,
+                   "mutation": None, "popSize": None }
+    if solver == "ga":
+        rng = random.Random(seed)
+        parameters["crossover"] = float(rng.randrange(20, 100, 5))/100
+        parameters["mutation"] = float(rng.randrange(0, 15, 1))/100
+        parameters["popSize"] = rng.randrange(10, 150, 10)
+    return parameters
+
+def initRestartWorker(distancesFileName, fragmentFileName, offsetsFileName,
+                      prepared=None):
+    # The .npy matrices are memory-mapped, so every worker shares one read-only
+    # copy through the page cache; the local search reads them in place
+    global preparedSearch
+    loadInputs(distancesFileName, fragmentFileName, offsetsFileName)
+    preparedSearch = prepared
+
+def runRestart(parameters):
+    """ Runs the restart described by getRestartParameters() in a worker """
+    startTime = time.time()
+    # The first restart of the local search is the unperturbed greedy tour
+    seed = parameters["seed"]
+    if parameters["solver"] == "local" and seed == 0:
+        seed = None
+    if parameters["solver"] == "ga":
+        score, sequence = solve(parameters["crossover"], parameters["mutation"],
+                                parameters["popSize"], "ga", seed)
+    else:
+        score, sequence = solve(solver="local", seed=seed)
+    result = dict(parameters)
+    result["score"] = int(score)
+    result["seconds"] = time.time() - startTime
+    return result, list(sequence)
+
+def runRestarts(distancesFileName, fragmentFileName, offsetsFileName,
+                numRestarts=None, workers=None, patience=None, solver=None):
+    """
+    Runs independent seeded searches on a process pool, keeping the best tour so
+    far and stopping early once the best score stops improving.
+
+    @return Tuple (best score, best sequence, list of result rows). Each row is a
+            dictionary of the restart's parameters, its score and its run time.
+    """
+    if numRestarts is None:
+        numRestarts = NUM_RESTARTS
+    if workers is None:
+        workers = RESTART_WORKERS
+    if patience is None:
+        patience = RESTART_PATIENCE
+    if solver is None:
+        solver = TOUR_SOLVER
+    # Run at most patience restarts at once, so that that many failing to improve
+    # in a row can still stop the rest, however many cores there are
+    workers = max(1, min(workers, patience))
+
+    bestScore = -1
+    bestSequence = []
+    rows = []
+    sinceImprovement = 0
+    nextSeed = 0
+
+    # Every local search starts from the same greedy tour and neighbor lists, so
+    # find them once here rather than in every restart
+    prepared = None
+    if solver == "local":
+        loadInputs(distancesFileName, fragmentFileName, offsetsFileName)
+        prepared = getPreparedSearch()
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=initRestartWorker,
+            initargs=(distancesFileName, fragmentFileName, offsetsFileName,
+                      prepared)) as pool:
+        running = set()
+        while nextSeed < numRestarts or len(running) > 0:
+            # Keep every worker busy until we run out of restarts or patience
+            while nextSeed < numRestarts and len(running) < workers \
+                    and sinceImprovement < patience:
+                running.add(pool.submit(runRestart, getRestartParameters(nextSeed, solver)))
+                nextSeed += 1
+            if len(running) == 0:
+                break
+
+            done, running = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                result, sequence = future.result()
+                rows.append(result)
+
+                # Lower scores (shorter layouts) are better
+                if bestScore == -1 or result["score"] < bestScore:
+                    bestScore = result["score"]
+                    bestSequence = sequence
+                    sinceImprovement = 0
+                else:
+                    sinceImprovement += 1
+
+    return bestScore, bestSequence, rows
+
+def writeResultsTable(fileName, rows):
+    """ Appends one tab-separated line per restart to the results table """
+    columns = ["seed", "solver", "crossover", "mutation", "popSize", "score", "seconds"]
+    writeHeader = not os.path.exists(fileName)
+    theFile = open(fileName, "a")
+    if writeHeader:
+        theFile.write("\t".join(columns) + "\n")
+    for row in rows:
+        values = ["%.3f" % row[c] if c == "seconds" else str(row[c]) for c in columns]
+        theFile.write("\t".join(values) + "\n")
+    theFile.close()
+
 def writeResults(fileNameNoExt, sequence, score, crossover, mutation, popSize):
     # Write the best sequence out to a file
     theFile = open(fileNameNoExt + ".txt", "w")
-    for num in sequence:
-        theFile.write(str(num))
-        theFile.write(" ")
-
-    # Write a second file in case we're running multiple tests at once
-    theFile = open(fileNameNoExt + "At" + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + ".txt", "w")
     for num in sequence:
         theFile.write(str(num) + " ")
 
-    theFile.write("\n# Parameters were: Pop size: ")
-    theFile.write(str(popSize))
-    theFile.write(", Crossover rate: ")
-    theFile.write(str(crossover))
+    if popSize is None:
+        theFile.write("\n# Found by the local search solver")
+    else:
+        theFile.write("\n# Parameters were: Pop size: ")
+        theFile.write(str(popSize))
+        theFile.write(", Crossover rate: ")
+        theFile.write(str(crossover))
 
-    theFile.write(", Mutation rate: ")
-    theFile.write(str(mutation))
+        theFile.write(", Mutation rate: ")
+        theFile.write(str(mutation))
 
     theFile.write("\n# Score was: ")
     theFile.write(str(score))
+    theFile.close()
 
 
 
 if __name__ == "__main__":
-    bestScore = -1
-    bestSequence = []
-    bestCrossover = -1
-    bestMutationRate = -1
-    bestPopSize = -1
+    if os.path.exists(FRAGMENT_STORE_FILE):
+        fragmentFileName = FRAGMENT_STORE_FILE
+    else:
+        fragmentFileName = "fragments.txt"
 
     # Repeat many times so that we vary the parameters of the model (results in much
     # better... results.)
-    for i in range(1):
-        crossover_rate = float(random.randrange(20, 100, 5))/100
-        mutation_rate = float(random.randrange(0, 15, 1))/100
-        population_size = random.randrange(10, 150, 10)
-        score, sequence = main_run("overlap.txt", "fragments.txt", crossover_rate, mutation_rate, population_size)
-
-        if score > bestScore:
-            bestScore = score
-            bestSequence = sequence
-
-            # Remember the parameters that gave us this score
-            bestCrossover = crossover_rate
-            bestMutationRate =mutation_rate
-            bestPopSize = population_size
+    bestScore, bestSequence, rows = runRestarts(findMatrixFile("overlap"), fragmentFileName,
+                                                findMatrixFile("offsets"))
+    writeResultsTable(RESULTS_TABLE_FILE, rows)
 
-        writeResults("bestAlignmentOrderSoFar", bestSequence, bestScore, bestCrossover, bestMutationRate, bestPopSize)
+    # Remember the parameters that gave us the best score
+    bestRow = [row for row in rows if row["score"] == bestScore][0]
 
-    print "Best score: ", bestScore
-    print "Sequence: ", bestSequence
+    print("Ran", len(rows), "restarts; results are in", RESULTS_TABLE_FILE)
+    print("Best score: ", bestScore)
+    print("Sequence: ", bestSequence)
 
-    writeResults("alignmentOrder", bestSequence, bestScore, bestCrossover, bestMutationRate, bestPopSize)
+    writeResults("alignmentOrder", bestSequence, bestScore, bestRow["crossover"], bestRow["mutation"], bestRow["popSize"])